@@ -1,4 +1,6 @@
+from agent.planner import BackgroundPlanner
 import pandas as pd
+import contextlib
 import dill
 
 
@@ -7,6 +9,9 @@ class AgentBasisClass:
         self.__name = name
         self.__actions = actions
         self.__gamma = gamma
+        self._executable_actions = dict()  # state -> actions executable in it
+        self.planner = None
+        self.snapshot = None
         self._number_of_episodes = 0
         self._number_of_steps = 0
 
@@ -38,6 +43,14 @@ class AgentBasisClass:
     def get_actions(self):
         return self.__actions
 
+    def get_executable_actions(self, state):
+        """
+        actions executable in state. values are bootstrapped over these actions of the next state
+        :param state: <State>
+        :return: <list> actions given by set_executable_actions (get_actions() if they were never given)
+        """
+        return self._executable_actions.get(state, self.__actions)
+
     # Setter
 
     def set_name(self, new_name):
@@ -49,22 +62,91 @@ class AgentBasisClass:
     def set_actions(self, new_actions):
         self.__actions = new_actions
 
+    def set_executable_actions(self, state, actions):
+        self._executable_actions[state] = actions
+
+    def set_background_planning(self, background):
+        """
+        :param background: <bool> if true, the planning passes of _plan() run on a background thread, and the
+                           policy is read from the snapshot of Q published after each finished pass
+        """
+        self.stop_planning()
+        self.planner = BackgroundPlanner(self._background_plan) if background else None
+        self.snapshot = None
+
     # Core
 
     def act(self, state): ...
 
+    def update_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Update by a batch of transitions. agents without a vectorized update apply update() to each transition
+        :param states: <list> states
+        :param actions: <list> actions taken in states
+        :param rewards: <array-like> rewards
+        :param next_states: <list> next states
+        :param dones: <array-like<bool>> whether each episode ended
+        """
+        for state, action, reward, next_state, done in zip(states, actions, rewards, next_states, dones):
+            self.update(state, action, reward, next_state, done)
+
+    def stop_planning(self):
+        """ wait for the requested planning passes and stop the background thread. the next request starts it again """
+        if self.planner is not None:
+            self.planner.wait()
+            self.planner.stop()
+
     def reset(self):
+        if self.planner is not None:
+            self.planner.wait()
+        self.snapshot = None
         self._number_of_steps = 0
         self._number_of_episodes = 0
+        self._executable_actions = dict()
 
     def reset_of_episode(self):
         self._number_of_steps = 0
         self._number_of_episodes += 1
 
+    def _plan(self):
+        """ one planning pass of a model-based agent """
+        raise NotImplementedError
+
+    def _request_plan(self):
+        """ run a planning pass now, or ask the background planner for one """
+        if self.planner is not None:
+            self.planner.request()
+        else:
+            self._plan()
+
+    def _background_plan(self):
+        self._plan()
+        with self.planner.lock:
+            self.snapshot = self.Q.copy()
+
+    def _get_lock(self):
+        """ the lock guarding the tables shared with the background planner (none without it) """
+        return self.planner.lock if self.planner is not None else contextlib.nullcontext()
+
+    def _get_policy_table(self):
+        """ the table act() reads: the snapshot published by the background planner, or Q itself """
+        return self.Q if self.snapshot is None else self.snapshot
+
+    def _get_action_rows(self, state_ids):
+        """
+        Q-values of many states over their executable actions, for the vectorized updates of tabular agents
+        :param state_ids: <np.ndarray<int>> QTable ids of states (-1 for unknown states)
+        :return: <np.ndarray> Q-values indexed by state and action id, -inf for the actions not executable
+        """
+        return self.Q.get_masked_rows(state_ids, self.Q.get_action_ids(self.get_actions(), add=True),
+                                      self._executable_actions)
+
     def q_to_csv(self, filename):
-        table = pd.DataFrame(self.Q, dtype=str)
+        table = pd.DataFrame(self.Q.to_dict(), dtype=str)
         table.to_csv(filename)
 
     def to_pickle(self, filename):
+        # a planning pass in progress would be pickled half done
+        self.stop_planning()
         with open(filename, "wb") as f:
             dill.dump(self, f)
@@ -1,5 +1,6 @@
 from agent.AgentBasis import AgentBasisClass
-from collections import defaultdict
+from agent.qtable import QTable
+from agent.model import EmpiricalModel
 import numpy as np
 import random
 
@@ -12,17 +13,39 @@ class DynaQAgent(AgentBasisClass):
                  epsilon=0.1,
                  lookahead=10,
                  actions=None,
-                 explore="uniform"):
+                 explore="uniform",
+                 temperature=1.0,
+                 batch_planning=False,
+                 consistent=True,
+                 background=False):
+        """
+        :param batch_planning: <bool> if true, the lookahead backups of a step are drawn at once and applied as
+                               one vectorized update whose targets use the Q-values before the backups
+        :param consistent: <bool> with batch_planning, a pair drawn k times moves towards its target by
+                           1 - (1 - alpha)^k, as k sequential backups with the same target would.
+                           otherwise it is backed up once with alpha
+        :param background: <bool> if true, the simulated experience is planned on a background thread and act()
+                           serves the greedy policy of the latest finished planning pass
+        """
         super().__init__(name, actions, gamma)
         self.alpha = self.init_alpha = alpha
         self.epsilon = self.init_epsilon = epsilon
         self.explore = explore
+        self.temperature = temperature
         self.lookahead = lookahead
+        self.batch_planning = batch_planning
+        self.consistent = consistent
 
-        self.Q = defaultdict(lambda: defaultdict(lambda: 0.0))
-        self.V = defaultdict(lambda: 0.0)
-        self.C_sas = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: 0)))
-        self.rewards = defaultdict(lambda: defaultdict(list))
+        self.Q = QTable()
+        self.model = EmpiricalModel()
+        self.__init_pair_ids()
+        self.set_background_planning(background)
+
+    def __init_pair_ids(self):
+        # QTable ids of each model pair and of its most likely successor, indexed by pair id
+        self.pair_state_ids = np.zeros(len(self.model.counts), dtype=int)
+        self.pair_action_ids = np.zeros(len(self.model.counts), dtype=int)
+        self.pair_next_state_ids = np.zeros(len(self.model.counts), dtype=int)
 
     # Accessors
 
@@ -31,11 +54,14 @@ class DynaQAgent(AgentBasisClass):
         params["alpha"] = self.alpha
         params["epsilon"] = self.epsilon
         params["explore"] = self.explore
+        params["temperature"] = self.temperature
         params["lookahead"] = self.lookahead
+        params["batch_planning"] = self.batch_planning
+        params["background"] = self.planner is not None
         return params
 
     def get_q_val(self, state, action):
-        return self.Q[state][action]
+        return self.Q.get(state, action)
 
     def get_policy(self, state):
         return self._get_max_q_key(state)
@@ -44,22 +70,13 @@ class DynaQAgent(AgentBasisClass):
         return self._get_max_q_val(state)
 
     def get_reward(self, state, action):
-        if self.get_count(state, action) == 0:
-            return 0.0
-        return float(sum(self.rewards[state][action])) / self.get_count(state, action)
+        return self.model.get_reward(state, action)
 
     def get_transition(self, state, action):
-        next_state_probabilities = dict()
-        for next_state in self.C_sas[state][action].keys():
-            prob = self.get_count(state, action, next_state) / self.get_count(state, action)
-            next_state_probabilities[next_state] = prob
-        return next_state_probabilities
+        return self.model.get_transition(state, action)
 
     def get_count(self, state, action, next_state=None):
-        if next_state is None:
-            return sum(self.C_sas[state][action].values())
-        else:
-            return self.C_sas[state][action][next_state]
+        return self.model.get_count(state, action, next_state)
 
     # Core
 
@@ -69,7 +86,7 @@ class DynaQAgent(AgentBasisClass):
         elif self.explore == "softmax":
             action = self._soft_max_policy(state)
         elif self.explore == "random":
-            action = random.choice(self.get_actions())
+            action = random.choice(self.get_executable_actions(state))
         else:
             action = self._epsilon_greedy_policy(state)  # default
 
@@ -78,36 +95,91 @@ class DynaQAgent(AgentBasisClass):
         return action
 
     def update(self, state, action, reward, next_state, done=False, **kwargs):
-        self.C_sas[state][action][next_state] += 1
-        self.rewards[state][action] += [reward]
-        next_action_value = 0
-        if not done:
-            next_action_value = self._get_max_q_val(next_state)
+        with self._get_lock():
+            self._update_model(state, action, reward, next_state)
+            next_action_value = 0
+            if not done:
+                next_action_value = self._get_max_q_val(next_state)
 
-        # real experience
-        diff = self.get_gamma() * next_action_value - self.get_q_val(state, action)
-        self.Q[state][action] += self.alpha * (reward + diff)
+            # real experience
+            diff = self.get_gamma() * next_action_value - self.get_q_val(state, action)
+            self.Q.add(state, action, self.alpha * (reward + diff))
 
         # simulated experience
+        self._request_plan()
+
+    def update_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Vectorized update. the real experience is applied as in QLearningAgent.update_batch, i.e. every target is
+        computed from the Q-values before the batch and the updates of repeated (state, action) pairs are merged.
+        then the model is planned with as many lookahead loops as update() would run for the batch
+        """
+        with self._get_lock():
+            for state, action, reward, next_state in zip(states, actions, rewards, next_states):
+                self._update_model(state, action, reward, next_state)
+
+            # real experience
+            state_ids = self.Q.get_state_ids(states, add=True)
+            action_ids = self.Q.get_action_ids(actions, add=True)
+            next_state_ids = self.Q.get_state_ids(next_states)
+            next_action_values = self._get_action_rows(next_state_ids).max(axis=1)
+            targets = np.asarray(rewards, dtype=float) + self.get_gamma() * np.where(dones, 0.0, next_action_values)
+            self.Q.add_merged(state_ids, action_ids, targets - self.Q.values[state_ids, action_ids], self.alpha)
+
+        # simulated experience
+        if self.planner is not None:
+            self.planner.request()
+        elif self.batch_planning:
+            self._plan_batch(self.lookahead * len(state_ids))
+        else:
+            for _ in range(len(state_ids)):
+                self._plan()
+
+    def _update_model(self, state, action, reward, next_state):
+        pair_id = self.model.add(state, action, reward, next_state)
+        if pair_id >= len(self.pair_state_ids):
+            size = len(self.model.counts)
+            self.pair_state_ids = np.resize(self.pair_state_ids, size)
+            self.pair_action_ids = np.resize(self.pair_action_ids, size)
+            self.pair_next_state_ids = np.resize(self.pair_next_state_ids, size)
+        self.pair_state_ids[pair_id] = self.Q.get_state_id(state, add=True)
+        self.pair_action_ids[pair_id] = self.Q.get_action_id(action, add=True)
+        self.pair_next_state_ids[pair_id] = self.Q.get_state_id(self.model.get_most_likely(state, action), add=True)
+
+    def _plan(self):
+        lock = self._get_lock()
+        if self.batch_planning:
+            with lock:
+                self._plan_batch(self.lookahead)
+            return
         for n in range(self.lookahead):
-            s = random.choice(list(self.C_sas.keys()))
-            a = random.choice(list(self.C_sas[s].keys()))
-            r = self.get_reward(s, a)
-            next_state_probabilities = self.get_transition(s, a)
-            if not next_state_probabilities == {}:
-                ns = max(next_state_probabilities, key=next_state_probabilities.get)
-            else:
-                ns = None
-            diff = self.get_gamma() * self._get_max_q_val(ns) - self.get_q_val(s, a)
-            self.Q[s][a] += self.alpha * (r + diff)
+            # the lock is taken per backup, so update() never waits for a whole planning pass
+            with lock:
+                s, a = self.model.sample_pair()
+                r = self.get_reward(s, a)
+                ns = self.model.get_most_likely(s, a)
+                diff = self.get_gamma() * self._get_max_q_val(ns) - self.get_q_val(s, a)
+                self.Q.add(s, a, self.alpha * (r + diff))
+
+    def _plan_batch(self, size):
+        """ draw size visited pairs uniformly and back them up towards their most likely successor at once """
+        # summing the k updates of a repeated pair would overshoot once alpha * k > 1, so repeats are merged
+        pair_ids, repeats = np.unique(np.random.randint(len(self.model), size=size), return_counts=True)
+        steps = 1.0 - (1.0 - self.alpha) ** repeats if self.consistent else self.alpha
+        state_ids, action_ids = self.pair_state_ids[pair_ids], self.pair_action_ids[pair_ids]
+        next_state_ids = self.pair_next_state_ids[pair_ids]
+        rewards = self.model.reward_sums[pair_ids] / self.model.counts[pair_ids]
+        next_action_values = self._get_action_rows(next_state_ids).max(axis=1)
+        td_errors = rewards + self.get_gamma() * next_action_values - self.Q.values[state_ids, action_ids]
+        self.Q.values[state_ids, action_ids] += steps * td_errors
 
     def reset(self):
         super().reset()
         self.alpha = self.init_alpha
         self.epsilon = self.init_epsilon
-        self.Q = defaultdict(lambda: defaultdict(lambda: 0.0))
-        self.C_sas = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: 0)))
-        self.rewards = defaultdict(lambda: defaultdict(list))
+        self.Q = QTable()
+        self.model = EmpiricalModel()
+        self.__init_pair_ids()
 
     def _get_max_q_key(self, state):
         return self._get_max_q(state)[0]
@@ -116,24 +188,14 @@ class DynaQAgent(AgentBasisClass):
         return self._get_max_q(state)[1]
 
     def _get_max_q(self, state):
-        tmp = self.get_actions()
-        best_action = random.choice(tmp)
-        actions = tmp[:]
-        np.random.shuffle(actions)
-        max_q_val = float("-inf")
-        for key in actions:
-            q_val = self.get_q_val(state, key)
-            if q_val > max_q_val:
-                best_action = key
-                max_q_val = q_val
-        return best_action, max_q_val
+        return self.Q.get_greedy(state, self.get_executable_actions(state))
 
     def _soft_max_policy(self, state):
-        pass
+        return self._get_policy_table().get_softmax(state, self.get_executable_actions(state), self.temperature)
 
     def _epsilon_greedy_policy(self, state):
         if self.epsilon > np.random.random():
-            action = random.choice(self.get_actions())
+            action = random.choice(self.get_executable_actions(state))
         else:
-            action = self._get_max_q_key(state)
+            action = self._get_policy_table().get_greedy(state, self.get_executable_actions(state))[0]
         return action
\ No newline at end of file
@@ -0,0 +1,132 @@
+import numpy as np
+import random
+
+
+class EmpiricalModel(object):
+    def __init__(self, capacity=64):
+        """
+        Empirical model of the observed transitions. every visited (state, action) pair gets a dense pair id;
+        visit counts and reward sums are arrays indexed by it, and each pair keeps a sparse list of its successors,
+        so memory grows with the number of distinct transitions rather than with the number of steps
+        :param capacity: <int> initial capacity of pairs
+        """
+        self.pair_index = dict()        # (state, action) -> pair id
+        self.pairs = []                 # pair id -> (state, action)
+        self.counts = np.zeros(capacity, dtype=int)
+        self.reward_sums = np.zeros(capacity, dtype=float)
+        self.successors = []            # pair id -> [next_state]
+        self.successor_index = []       # pair id -> {next_state: index in successors}
+        self.successor_counts = []      # pair id -> [count of each successor]
+        self.modes = []                 # pair id -> index of the most frequent successor
+        self.alias_tables = []          # pair id -> (probs, aliases), None until sampled after a change
+
+    def __len__(self):
+        return len(self.pairs)
+
+    # Accessors
+
+    def get_pair_id(self, state, action):
+        """ :return: <int> id of the pair (None if it was never visited) """
+        return self.pair_index.get((state, action))
+
+    def get_pair(self, pair_id):
+        return self.pairs[pair_id]
+
+    def get_count(self, state, action, next_state=None):
+        pair_id = self.pair_index.get((state, action))
+        if pair_id is None:
+            return 0
+        if next_state is None:
+            return self.counts.item(pair_id)
+        j = self.successor_index[pair_id].get(next_state)
+        return 0 if j is None else self.successor_counts[pair_id][j]
+
+    def get_reward(self, state, action):
+        """ :return: <float> mean reward of the pair (0.0 if it was never visited) """
+        pair_id = self.pair_index.get((state, action))
+        if pair_id is None:
+            return 0.0
+        return self.reward_sums.item(pair_id) / self.counts.item(pair_id)
+
+    def get_transition(self, state, action):
+        """ :return: <dict> empirical probability of each observed next state """
+        pair_id = self.pair_index.get((state, action))
+        if pair_id is None:
+            return dict()
+        count = self.counts.item(pair_id)
+        return {next_state: n / count
+                for next_state, n in zip(self.successors[pair_id], self.successor_counts[pair_id])}
+
+    def get_most_likely(self, state, action):
+        """ :return: the most frequent next state of the pair (None if it was never visited) """
+        pair_id = self.pair_index.get((state, action))
+        if pair_id is None:
+            return None
+        return self.successors[pair_id][self.modes[pair_id]]
+
+    # Core
+
+    def add(self, state, action, reward, next_state):
+        """
+        record a transition
+        :return: <int> id of the pair
+        """
+        pair_id = self.pair_index.get((state, action))
+        if pair_id is None:
+            pair_id = self.pair_index[(state, action)] = len(self.pairs)
+            self.pairs.append((state, action))
+            self.successors.append([])
+            self.successor_index.append(dict())
+            self.successor_counts.append([])
+            self.modes.append(0)
+            self.alias_tables.append(None)
+            if pair_id >= len(self.counts):
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+                self.reward_sums = np.concatenate([self.reward_sums, np.zeros_like(self.reward_sums)])
+        self.counts[pair_id] += 1
+        self.reward_sums[pair_id] += reward
+
+        successor_counts = self.successor_counts[pair_id]
+        j = self.successor_index[pair_id].get(next_state)
+        if j is None:
+            j = self.successor_index[pair_id][next_state] = len(successor_counts)
+            self.successors[pair_id].append(next_state)
+            successor_counts.append(0)
+        successor_counts[j] += 1
+        if successor_counts[j] > successor_counts[self.modes[pair_id]]:
+            self.modes[pair_id] = j
+        self.alias_tables[pair_id] = None
+        return pair_id
+
+    def sample_pair(self):
+        """ :return: <tuple> a visited (state, action) drawn uniformly at random """
+        return self.pairs[int(random.random() * len(self.pairs))]
+
+    def sample_next_state(self, state, action):
+        """ draw a next state of a visited pair from its empirical distribution in O(1) with an alias table """
+        pair_id = self.pair_index[(state, action)]
+        if self.alias_tables[pair_id] is None:
+            self.alias_tables[pair_id] = _make_alias_table(self.successor_counts[pair_id])
+        probs, aliases = self.alias_tables[pair_id]
+        j = int(random.random() * len(probs))
+        if random.random() >= probs[j]:
+            j = aliases[j]
+        return self.successors[pair_id][j]
+
+    def clear(self):
+        self.__init__(len(self.counts))
+
+
+def _make_alias_table(counts):
+    """ Vose's alias method. entry j keeps itself with probs[j] and is replaced by aliases[j] otherwise """
+    n, total = len(counts), float(sum(counts))
+    scaled = [c * n / total for c in counts]
+    probs, aliases = [1.0] * n, list(range(n))
+    small = [j for j, p in enumerate(scaled) if p < 1.0]
+    large = [j for j, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        probs[s], aliases[s] = scaled[s], l
+        scaled[l] -= 1.0 - scaled[s]
+        (small if scaled[l] < 1.0 else large).append(l)
+    return probs, aliases
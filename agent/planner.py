@@ -0,0 +1,86 @@
+import threading
+
+
+class BackgroundPlanner(object):
+    def __init__(self, plan_func):
+        """
+        Run planning passes on a daemon thread, so update() only has to record the experience.
+        requests made while a pass is running are merged into one following pass
+        :param plan_func: <callable> one planning pass. it must take lock around every access to the shared tables
+        """
+        self.plan_func = plan_func
+        self.lock = threading.RLock()     # guards the tables shared by the acting and the planning thread
+        self.passes = 0
+        self.__condition = threading.Condition()
+        self.__requested = False
+        self.__busy = False
+        self.__stopped = False
+        self.__error = None
+        self.__thread = None
+
+    def __getstate__(self):
+        # threads and locks cannot be pickled; the thread is started again by the next request
+        return {"plan_func": self.plan_func, "passes": self.passes}
+
+    def __setstate__(self, state):
+        self.__init__(state["plan_func"])
+        self.passes = state["passes"]
+
+    # Accessors
+
+    def is_idle(self):
+        with self.__condition:
+            return not (self.__requested or self.__busy)
+
+    # Core
+
+    def request(self):
+        """ ask for a planning pass and return immediately """
+        with self.__condition:
+            self.__raise_error()
+            self.__requested = True
+            if self.__thread is None:
+                self.__stopped = False
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+            self.__condition.notify_all()
+
+    def wait(self):
+        """ block until every requested pass has finished """
+        with self.__condition:
+            while (self.__requested or self.__busy) and self.__error is None:
+                self.__condition.wait()
+            self.__raise_error()
+
+    def stop(self):
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify_all()
+            thread, self.__thread = self.__thread, None
+        if thread is not None:
+            thread.join()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__requested and not self.__stopped:
+                    self.__condition.wait()
+                if self.__stopped:
+                    return
+                self.__requested, self.__busy = False, True
+            try:
+                self.plan_func()
+            except Exception as e:
+                with self.__condition:
+                    self.__error, self.__busy, self.__thread = e, False, None
+                    self.__condition.notify_all()
+                return
+            with self.__condition:
+                self.__busy = False
+                self.passes += 1
+                self.__condition.notify_all()
+
+    def __raise_error(self):
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise RuntimeError("background planning failed") from error
@@ -0,0 +1,155 @@
+from agent.AgentBasis import AgentBasisClass
+from agent.qtable import QTable
+from agent.model import EmpiricalModel
+import numpy as np
+import itertools
+import heapq
+import random
+
+
+class PrioritizedSweepingAgent(AgentBasisClass):
+    def __init__(self,
+                 name="PrioritizedSweepingAgent",
+                 gamma=0.99,
+                 epsilon=0.1,
+                 lookahead=10,
+                 theta=1e-4,
+                 actions=None,
+                 explore="uniform",
+                 temperature=1.0):
+        """
+        Prioritized sweeping. (state, action) pairs are backed up in the order of their Bellman error, and a backup
+        queues the predecessors of the state, so planning follows the states whose values actually changed
+        :param lookahead: <int> maximum number of planning backups per real step
+        :param theta: <float> pairs whose Bellman error is not larger than this are not queued
+        """
+        super().__init__(name, actions, gamma)
+        self.epsilon = self.init_epsilon = epsilon
+        self.explore = explore
+        self.temperature = temperature
+        self.lookahead = lookahead
+        self.theta = theta
+
+        self.Q = QTable()
+        self.__init_model()
+
+    def __init_model(self):
+        self.model = EmpiricalModel()
+        self.terminals = set()      # states in which an episode ended
+        self.predecessors = dict()  # next_state -> {(state, action)}
+        self.queue = []
+        self.queued = dict()        # (state, action) -> priority of its live entry in queue
+        self.counter = itertools.count()
+
+    # Accessors
+
+    def get_params(self):
+        params = super().get_params()
+        params["epsilon"] = self.epsilon
+        params["explore"] = self.explore
+        params["temperature"] = self.temperature
+        params["lookahead"] = self.lookahead
+        params["theta"] = self.theta
+        return params
+
+    def get_q_val(self, state, action):
+        return self.Q.get(state, action)
+
+    def get_policy(self, state):
+        return self._get_max_q_key(state)
+
+    def get_value(self, state):
+        return self._get_max_q_val(state)
+
+    def get_reward(self, state, action):
+        return self.model.get_reward(state, action)
+
+    def get_transition(self, state, action):
+        return self.model.get_transition(state, action)
+
+    def get_count(self, state, action, next_state=None):
+        return self.model.get_count(state, action, next_state)
+
+    # Core
+
+    def act(self, state):
+        if self.explore == "uniform":
+            action = self._epsilon_greedy_policy(state)
+        elif self.explore == "softmax":
+            action = self._soft_max_policy(state)
+        elif self.explore == "random":
+            action = random.choice(self.get_executable_actions(state))
+        else:
+            action = self._epsilon_greedy_policy(state)  # default
+
+        self._number_of_steps += 1
+
+        return action
+
+    def update(self, state, action, reward, next_state, done=False, **kwargs):
+        self._update_model(state, action, reward, next_state, done)
+        self._push(state, action)
+
+        for n in range(self.lookahead):
+            if not self.queued:
+                break
+            s, a = self._pop()
+            self.Q.set(s, a, self._get_backup(s, a))
+            for ps, pa in self.predecessors.get(s, ()):
+                self._push(ps, pa)
+
+    def reset(self):
+        super().reset()
+        self.epsilon = self.init_epsilon
+        self.Q = QTable()
+        self.__init_model()
+
+    def _update_model(self, state, action, reward, next_state, done):
+        self.model.add(state, action, reward, next_state)
+        self.predecessors.setdefault(next_state, set()).add((state, action))
+        if done:
+            self.terminals.add(state)
+
+    def _get_backup(self, state, action):
+        """ expected one-step return of (state, action) under the empirical model """
+        value = self.get_reward(state, action)
+        if state not in self.terminals:
+            value += self.get_gamma() * sum(p * self._get_max_q_val(ns)
+                                            for ns, p in self.get_transition(state, action).items())
+        return value
+
+    def _push(self, state, action):
+        priority = abs(self._get_backup(state, action) - self.get_q_val(state, action))
+        if priority > self.theta and priority > self.queued.get((state, action), 0.0):
+            # the older entry of the pair stays in the heap and is skipped by _pop
+            self.queued[(state, action)] = priority
+            heapq.heappush(self.queue, (-priority, next(self.counter), state, action))
+            if len(self.queue) > 4 * len(self.queued) + 64:
+                self.queue = [entry for entry in self.queue if self.queued.get((entry[2], entry[3])) == -entry[0]]
+                heapq.heapify(self.queue)
+
+    def _pop(self):
+        while True:
+            priority, _, state, action = heapq.heappop(self.queue)
+            if self.queued.get((state, action)) == -priority:
+                del self.queued[(state, action)]
+                return state, action
+
+    def _get_max_q_key(self, state):
+        return self._get_max_q(state)[0]
+
+    def _get_max_q_val(self, state):
+        return self._get_max_q(state)[1]
+
+    def _get_max_q(self, state):
+        return self.Q.get_greedy(state, self.get_executable_actions(state))
+
+    def _soft_max_policy(self, state):
+        return self.Q.get_softmax(state, self.get_executable_actions(state), self.temperature)
+
+    def _epsilon_greedy_policy(self, state):
+        if self.epsilon > np.random.random():
+            action = random.choice(self.get_executable_actions(state))
+        else:
+            action = self._get_max_q_key(state)
+        return action
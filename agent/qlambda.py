@@ -0,0 +1,68 @@
+from agent.AgentBasis import AgentBasisClass
+from agent.qlearning import QLearningAgent
+from agent.traces import EligibilityTraces
+
+
+class QLambdaAgent(QLearningAgent):
+    def __init__(self,
+                 name="QLambdaAgent",
+                 alpha=0.1,
+                 gamma=0.99,
+                 epsilon=0.1,
+                 lam=0.9,
+                 trace="replacing",
+                 cutoff=0.01,
+                 explore="uniform",
+                 temperature=1.0,
+                 actions=None):
+        """
+        Watkins's Q(lambda)
+        :param lam: <float> decay rate of the eligibility traces
+        :param trace: <str> "replacing" or "accumulating"
+        :param cutoff: <float> traces below this value are dropped
+        """
+        super().__init__(name, alpha, gamma, epsilon, explore, temperature, actions)
+        self.lam = lam
+        self.trace = trace
+        self.cutoff = cutoff
+
+        self.traces = EligibilityTraces(cutoff, trace == "replacing")
+
+    # Accessors
+
+    def get_params(self):
+        params = super().get_params()
+        params["lambda"] = self.lam
+        params["trace"] = self.trace
+        params["cutoff"] = self.cutoff
+        return params
+
+    # Core
+
+    def update(self, state, action, reward, next_state, done=False, **kwargs):
+        next_action_value = 0
+        if not done:
+            next_action_value = self._get_max_q_val(next_state)
+        q_val = self.get_q_val(state, action)
+        # an exploratory action cuts the traces of the earlier steps
+        if q_val < self._get_max_q_val(state):
+            self.traces.clear()
+        delta = reward + self.get_gamma() * next_action_value - q_val
+
+        self.traces.visit(self.Q.get_state_id(state, add=True), self.Q.get_action_id(action, add=True))
+        self.traces.apply(self.Q.values, self.alpha * delta)
+        if done:
+            self.traces.clear()
+        else:
+            self.traces.decay(self.get_gamma() * self.lam)
+
+    # traces make every update depend on the previous one, so a batch is applied transition by transition
+    update_batch = AgentBasisClass.update_batch
+
+    def reset(self):
+        super().reset()
+        self.traces.clear()
+
+    def reset_of_episode(self):
+        super().reset_of_episode()
+        self.traces.clear()
@@ -1,5 +1,6 @@
 from agent.AgentBasis import AgentBasisClass
-from collections import defaultdict
+from agent.qtable import QTable
+from agent.replay import ReplayBuffer
 import numpy as np
 import random
 
@@ -11,13 +12,25 @@ class QLearningAgent(AgentBasisClass):
                  gamma=0.99,
                  epsilon=0.1,
                  explore="uniform",
-                 actions=None):
+                 temperature=1.0,
+                 actions=None,
+                 replay=0,
+                 replay_capacity=10000,
+                 priority=0.0):
+        """
+        :param replay: <int> number of transitions replayed from the buffer per real step. 0 disables replay
+        :param replay_capacity: <int> number of transitions kept in the replay buffer
+        :param priority: <float> priority exponent of the replay buffer. 0 replays uniformly
+        """
         super().__init__(name, actions, gamma)
         self.alpha = self.init_alpha = alpha
         self.epsilon = self.init_epsilon = epsilon
         self.explore = explore
+        self.temperature = temperature
 
-        self.Q = defaultdict(lambda: defaultdict(lambda: 0.0))
+        self.Q = QTable()
+        self.replay = replay
+        self.buffer = ReplayBuffer(replay_capacity, priority) if replay > 0 else None
 
     # Accessors
 
@@ -26,13 +39,17 @@ class QLearningAgent(AgentBasisClass):
         params["alpha"] = self.alpha
         params["epsilon"] = self.epsilon
         params["explore"] = self.explore
+        params["temperature"] = self.temperature
+        if self.buffer is not None:
+            params["replay"] = self.replay
+            params["priority"] = self.buffer.alpha
         return params
 
     def get_alpha(self):
         return self.alpha
 
     def get_q_val(self, state, action):
-        return self.Q[state][action]
+        return self.Q.get(state, action)
 
     def get_policy(self, state):
         return self._get_max_q_key(state)
@@ -53,7 +70,7 @@ class QLearningAgent(AgentBasisClass):
         elif self.explore == "softmax":
             action = self._soft_max_policy(state)
         elif self.explore == "random":
-            action = random.choice(self.get_actions())
+            action = random.choice(self.get_executable_actions(state))
         else:
             action = self._epsilon_greedy_policy(state)  # default
 
@@ -66,14 +83,53 @@ class QLearningAgent(AgentBasisClass):
         if not done:
             next_action_value = self._get_max_q_val(next_state)
         diff = self.get_gamma() * next_action_value - self.get_q_val(state, action)
-        self.Q[state][action] += self.alpha * (reward + diff)
+        self.Q.add(state, action, self.alpha * (reward + diff))
         # print(state, action, self.Q[state][action])
 
+        if self.buffer is not None:
+            self.buffer.add(self.Q.get_state_id(state), self.Q.get_action_id(action), reward,
+                            self.Q.get_state_id(next_state, add=True), done)
+            self._replay()
+
+    def update_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Vectorized update. every target is computed from the Q-values before the batch, and the updates of
+        repeated (state, action) pairs are merged (see QTable.add_merged)
+        """
+        state_ids = self.Q.get_state_ids(states, add=True)
+        action_ids = self.Q.get_action_ids(actions, add=True)
+        next_state_ids = self.Q.get_state_ids(next_states, add=self.buffer is not None)
+        self._update_ids(state_ids, action_ids, np.asarray(rewards, dtype=float), next_state_ids, dones)
+
+        if self.buffer is not None:
+            self.buffer.add_batch(state_ids, action_ids, rewards, next_state_ids, dones)
+            self._replay()
+
     def reset(self):
         super().reset()
         self.alpha = self.init_alpha
         self.epsilon = self.init_epsilon
-        self.Q = defaultdict(lambda: defaultdict(lambda: 0.0))
+        self.Q = QTable()
+        if self.buffer is not None:
+            self.buffer.clear()
+
+    def _update_ids(self, state_ids, action_ids, rewards, next_state_ids, dones, weights=None):
+        """
+        batched Q-learning update on QTable ids (-1 for unknown next states)
+        :param weights: <np.ndarray> importance sampling weights of the transitions (None for plain updates)
+        :return: <np.ndarray> TD errors before the update
+        """
+        next_action_values = self._get_action_rows(next_state_ids).max(axis=1)
+        targets = rewards + self.get_gamma() * np.where(dones, 0.0, next_action_values)
+        td_errors = targets - self.Q.values[state_ids, action_ids]
+        self.Q.add_merged(state_ids, action_ids, td_errors, self.alpha, weights)
+        return td_errors
+
+    def _replay(self):
+        indices, state_ids, action_ids, rewards, next_state_ids, dones, weights = self.buffer.sample(self.replay)
+        td_errors = self._update_ids(state_ids, action_ids, rewards, next_state_ids, dones, weights)
+        if self.buffer.is_prioritized():
+            self.buffer.update_priorities(indices, td_errors)
 
     def _get_max_q_key(self, state):
         return self._get_max_q(state)[0]
@@ -82,24 +138,14 @@ class QLearningAgent(AgentBasisClass):
         return self._get_max_q(state)[1]
 
     def _get_max_q(self, state):
-        tmp = self.get_actions()
-        best_action = random.choice(self.get_actions())
-        actions = tmp[:]
-        np.random.shuffle(actions)
-        max_q_val = float("-inf")
-        for key in actions:
-            q_val = self.get_q_val(state, key)
-            if q_val > max_q_val:
-                best_action = key
-                max_q_val = q_val
-        return best_action, max_q_val
+        return self.Q.get_greedy(state, self.get_executable_actions(state))
 
     def _soft_max_policy(self, state):
-        pass
+        return self.Q.get_softmax(state, self.get_executable_actions(state), self.temperature)
 
     def _epsilon_greedy_policy(self, state):
         if self.epsilon > np.random.random():
-            action = random.choice(self.get_actions())
+            action = random.choice(self.get_executable_actions(state))
         else:
             action = self._get_max_q_key(state)
         return action
\ No newline at end of file
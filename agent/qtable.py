@@ -0,0 +1,294 @@
+import numpy as np
+import random
+
+
+class QTable(object):
+    def __init__(self, default=0.0, num_states=64, num_actions=8):
+        """
+        Q-values in a growable array indexed by state id x action id.
+        ids are given to states and actions in order of their first update; reading never adds an entry.
+        :param default: <float> value of (state, action) pairs which have never been updated
+        :param num_states: <int> initial capacity of states
+        :param num_actions: <int> initial capacity of actions
+        """
+        self.default = default
+        self.values = np.full((num_states, num_actions), default, dtype=float)
+        # executable actions of each state, filled by get_masked_rows
+        self.__masks = np.zeros((num_states, num_actions), dtype=bool)
+        self.__masked = np.zeros(num_states, dtype=bool)
+        self.__state_index = dict()
+        self.__action_index = dict()
+        self.__states = []
+        self.__actions = []
+
+    def __len__(self):
+        return len(self.__states)
+
+    def __contains__(self, state):
+        return state in self.__state_index
+
+    # Accessors
+
+    def get_states(self):
+        return self.__states
+
+    def get_actions(self):
+        return self.__actions
+
+    def get_state_id(self, state, add=False):
+        """
+        :param state: <State>
+        :param add: <bool> if true, give a new id to an unknown state
+        :return: <int> id of state (None if it is unknown and add is false)
+        """
+        state_id = self.__state_index.get(state)
+        if state_id is None and add:
+            state_id = self.__state_index[state] = len(self.__states)
+            self.__states.append(state)
+            if state_id >= self.values.shape[0]:
+                self.__grow(2 * state_id + 1, self.values.shape[1])
+        return state_id
+
+    def get_action_id(self, action, add=False):
+        """
+        :param action: <Any>
+        :param add: <bool> if true, give a new id to an unknown action
+        :return: <int> id of action (None if it is unknown and add is false)
+        """
+        action_id = self.__action_index.get(action)
+        if action_id is None and add:
+            action_id = self.__action_index[action] = len(self.__actions)
+            self.__actions.append(action)
+            if action_id >= self.values.shape[1]:
+                self.__grow(self.values.shape[0], 2 * action_id + 1)
+        return action_id
+
+    def get_state_ids(self, states, add=False):
+        """
+        :param states: <list> states
+        :param add: <bool> if true, give new ids to unknown states
+        :return: <np.ndarray<int>> ids of states (-1 for unknown states)
+        """
+        state_ids = [self.get_state_id(state, add) for state in states]
+        return np.array([-1 if i is None else i for i in state_ids], dtype=int)
+
+    def get_action_ids(self, actions, add=False):
+        """
+        :param actions: <list> actions
+        :param add: <bool> if true, give new ids to unknown actions
+        :return: <np.ndarray<int>> ids of actions (-1 for unknown actions)
+        """
+        action_ids = [self.get_action_id(action, add) for action in actions]
+        return np.array([-1 if i is None else i for i in action_ids], dtype=int)
+
+    def get(self, state, action):
+        state_id = self.__state_index.get(state)
+        action_id = self.__action_index.get(action)
+        if state_id is None or action_id is None:
+            return self.default
+        return self.values.item(state_id, action_id)
+
+    def get_row(self, state, actions):
+        """
+        :param state: <State>
+        :param actions: <list> actions to read
+        :return: <np.ndarray> Q-values of state for each action in actions
+        """
+        state_id = self.__state_index.get(state)
+        if state_id is None:
+            return np.full(len(actions), self.default)
+        action_ids = [self.__action_index.get(a, -1) for a in actions]
+        row = self.values[state_id, action_ids]
+        if -1 in action_ids:
+            row[np.equal(action_ids, -1)] = self.default
+        return row
+
+    def get_greedy(self, state, actions):
+        """
+        greedy action of state among actions. ties are broken uniformly at random by reservoir sampling,
+        so the action list is neither copied nor shuffled
+        :param state: <State>
+        :param actions: <list> candidate actions
+        :return: <tuple> the greedy action and its Q-value
+        """
+        state_id = self.__state_index.get(state)
+        if state_id is None:
+            return actions[int(random.random() * len(actions))], self.default
+        row = self.values[state_id]
+        action_index = self.__action_index
+        best_action, max_q_val, ties = None, float("-inf"), 0
+        for action in actions:
+            action_id = action_index.get(action)
+            q_val = self.default if action_id is None else row.item(action_id)
+            if q_val > max_q_val:
+                best_action, max_q_val, ties = action, q_val, 1
+            elif q_val == max_q_val:
+                ties += 1
+                if random.random() * ties < 1.0:
+                    best_action = action
+        return best_action, max_q_val
+
+    def get_rows(self, state_ids, action_ids):
+        """
+        :param state_ids: <np.ndarray<int>> ids of states (-1 for unknown states)
+        :param action_ids: <np.ndarray<int>> ids of candidate actions (-1 for unknown actions)
+        :return: <np.ndarray> Q-values with shape (len(state_ids), len(action_ids))
+        """
+        rows = self.values[np.ix_(state_ids, action_ids)]
+        rows[state_ids < 0] = self.default
+        rows[:, action_ids < 0] = self.default
+        return rows
+
+    def get_masked_rows(self, state_ids, action_ids, state_actions):
+        """
+        Q-values of many states over their own executable actions. the actions in state_actions are given ids
+        :param state_ids: <np.ndarray<int>> ids of states (-1 for unknown states)
+        :param action_ids: <np.ndarray<int>> ids of the actions of states which are not in state_actions (all known)
+        :param state_actions: <dict> state -> executable actions
+        :return: <np.ndarray> Q-values with shape (len(state_ids), capacity of actions) indexed by action id,
+                 -inf for the actions which are not executable in the state
+        """
+        known = state_ids >= 0
+        unmasked = np.unique(state_ids[known])
+        for state_id in unmasked[~self.__masked[unmasked]]:
+            actions = state_actions.get(self.__states[state_id])
+            if actions is not None:
+                # the ids are taken first, since adding them may grow the arrays
+                ids = self.get_action_ids(actions, add=True)
+                self.__masks[state_id, ids] = True
+                self.__masked[state_id] = True
+        masks = np.zeros((len(state_ids), self.values.shape[1]), dtype=bool)
+        masks[:, action_ids] = True
+        masked = known.copy()
+        masked[known] = self.__masked[state_ids[known]]
+        masks[masked] = self.__masks[state_ids[masked]]
+        rows = self.values[state_ids]
+        rows[~known] = self.default
+        return np.where(masks, rows, -np.inf)
+
+    def get_greedy_batch(self, state_ids, action_ids, state_actions=None):
+        """
+        greedy actions of many states at once. ties are broken uniformly at random
+        :param state_ids: <np.ndarray<int>> ids of states (-1 for unknown states)
+        :param action_ids: <np.ndarray<int>> ids of candidate actions (-1 for unknown actions)
+        :param state_actions: <dict> state -> executable actions. if given, each state chooses among its own
+                              actions (see get_masked_rows) and the indices are action ids
+        :return: <tuple> indices of the greedy actions in action_ids and their Q-values
+        """
+        rows = self.__get_candidate_rows(state_ids, action_ids, state_actions)
+        max_q_vals = rows.max(axis=1)
+        ties = rows == max_q_vals[:, None]
+        indices = np.argmax(np.random.random(rows.shape) * ties, axis=1)
+        return indices, max_q_vals
+
+    def get_softmax(self, state, actions, temperature=1.0):
+        """
+        draw an action of state from the Boltzmann distribution exp(Q / temperature)
+        :param state: <State>
+        :param actions: <list> candidate actions
+        :param temperature: <float> larger values explore more
+        :return: <Any> the drawn action
+        """
+        cdf = _softmax_cdf(self.get_row(state, actions)[None, :], temperature)[0]
+        return actions[min(np.searchsorted(cdf, np.random.random() * cdf[-1], side="right"), len(actions) - 1)]
+
+    def get_softmax_batch(self, state_ids, action_ids, temperature=1.0, state_actions=None):
+        """
+        draw actions of many states from the Boltzmann distribution with one uniform number per state
+        :param state_ids: <np.ndarray<int>> ids of states (-1 for unknown states)
+        :param action_ids: <np.ndarray<int>> ids of candidate actions (-1 for unknown actions)
+        :param temperature: <float> larger values explore more
+        :param state_actions: <dict> state -> executable actions. if given, each state draws among its own
+                              actions (see get_masked_rows) and the indices are action ids
+        :return: <np.ndarray<int>> indices of the drawn actions in action_ids
+        """
+        rows = self.__get_candidate_rows(state_ids, action_ids, state_actions)
+        cdf = _softmax_cdf(rows, temperature)
+        u = np.random.random(len(state_ids)) * cdf[:, -1]
+        # entries which are not executable add exp(-inf) = 0 to the cdf, so they are never drawn
+        return np.minimum(np.count_nonzero(cdf <= u[:, None], axis=1), rows.shape[1] - 1)
+
+    def to_dict(self):
+        """ return Q-values as a nested dict {state: {action: value}} of the updated entries """
+        return {s: {a: self.values.item(i, j) for j, a in enumerate(self.__actions)}
+                for i, s in enumerate(self.__states)}
+
+    # Setters
+
+    def set(self, state, action, value):
+        # the ids are taken first, since adding them may replace self.values with a larger array
+        state_id, action_id = self.get_state_id(state, add=True), self.get_action_id(action, add=True)
+        self.values[state_id, action_id] = value
+
+    def add(self, state, action, delta):
+        state_id, action_id = self.get_state_id(state, add=True), self.get_action_id(action, add=True)
+        self.values[state_id, action_id] += delta
+
+    def add_merged(self, state_ids, action_ids, td_errors, alpha, weights=None):
+        """
+        batched TD step on entries of known ids. the TD errors of a (state, action) pair repeated k times are
+        averaged and the pair moves towards them by 1 - (1 - alpha)^k, as k sequential updates with the same target
+        would. summing the k steps instead overshoots the target once alpha * k > 1
+        :param state_ids: <np.ndarray<int>> ids of states
+        :param action_ids: <np.ndarray<int>> ids of actions
+        :param td_errors: <np.ndarray> TD error of each (state, action) pair
+        :param alpha: <float> step size of a single update
+        :param weights: <np.ndarray> importance sampling weight of each pair. a merged pair uses the weighted mean
+                        of its TD errors and the step size alpha times its mean weight
+        """
+        flat_ids = np.asarray(state_ids) * self.values.shape[1] + np.asarray(action_ids)
+        pair_ids, inverse, repeats = np.unique(flat_ids, return_inverse=True, return_counts=True)
+        if weights is None:
+            mean_td_errors = np.bincount(inverse, weights=td_errors, minlength=len(pair_ids)) / repeats
+            steps = 1.0 - (1.0 - alpha) ** repeats
+        else:
+            weight_sums = np.bincount(inverse, weights=weights, minlength=len(pair_ids))
+            weighted_sums = np.bincount(inverse, weights=weights * td_errors, minlength=len(pair_ids))
+            mean_td_errors = np.divide(weighted_sums, weight_sums, out=np.zeros(len(pair_ids)), where=weight_sums > 0)
+            steps = 1.0 - (1.0 - alpha * weight_sums / repeats) ** repeats
+        # values is C-contiguous, so reshape returns a view
+        self.values.reshape(-1)[pair_ids] += steps * mean_td_errors
+
+    # Core
+
+    def copy(self):
+        """ independent copy, e.g. a snapshot which stays valid while this table keeps being updated """
+        table = QTable(self.default, 0, 0)
+        table.values = self.values.copy()
+        table.__masks = self.__masks.copy()
+        table.__masked = self.__masked.copy()
+        table.__state_index = dict(self.__state_index)
+        table.__action_index = dict(self.__action_index)
+        table.__states = list(self.__states)
+        table.__actions = list(self.__actions)
+        return table
+
+    def clear(self):
+        self.values[:] = self.default
+        self.__masks[:] = False
+        self.__masked[:] = False
+        self.__state_index = dict()
+        self.__action_index = dict()
+        self.__states = []
+        self.__actions = []
+
+    def __get_candidate_rows(self, state_ids, action_ids, state_actions):
+        if state_actions is None:
+            return self.get_rows(state_ids, action_ids)
+        return self.get_masked_rows(state_ids, action_ids, state_actions)
+
+    def __grow(self, num_states, num_actions):
+        values = np.full((num_states, num_actions), self.default, dtype=float)
+        values[:self.values.shape[0], :self.values.shape[1]] = self.values
+        self.values = values
+        masks = np.zeros((num_states, num_actions), dtype=bool)
+        masks[:self.__masks.shape[0], :self.__masks.shape[1]] = self.__masks
+        self.__masks = masks
+        self.__masked = np.concatenate([self.__masked, np.zeros(num_states - len(self.__masked), dtype=bool)])
+
+
+def _softmax_cdf(rows, temperature):
+    """ unnormalized cumulative softmax of each row. the row max is subtracted first (log-sum-exp), so it never
+    overflows and the largest entry is always exp(0) = 1 """
+    logits = rows / temperature
+    return np.cumsum(np.exp(logits - logits.max(axis=1, keepdims=True)), axis=1)
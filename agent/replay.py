@@ -0,0 +1,87 @@
+import numpy as np
+
+
+class ReplayBuffer(object):
+    def __init__(self, capacity=10000, alpha=0.0, beta=0.4, eps=1e-6):
+        """
+        Preallocated ring buffer of transitions (state id, action id, reward, next state id, done).
+        the oldest transition is overwritten when the buffer is full
+        :param capacity: <int> number of transitions kept
+        :param alpha: <float> priority exponent. 0 samples uniformly, larger values prefer large TD errors
+        :param beta: <float> exponent of the importance sampling weights of prioritized samples
+        :param eps: <float> added to |TD error| so that every transition keeps a chance to be sampled
+        """
+        self.capacity = capacity
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        self.state_ids = np.zeros(capacity, dtype=int)
+        self.action_ids = np.zeros(capacity, dtype=int)
+        self.rewards = np.zeros(capacity, dtype=float)
+        self.next_state_ids = np.zeros(capacity, dtype=int)
+        self.dones = np.zeros(capacity, dtype=bool)
+        self.priorities = np.zeros(capacity, dtype=float)
+        self.max_priority = 1.0
+        self.position = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    # Accessors
+
+    def is_prioritized(self):
+        return self.alpha > 0.0
+
+    # Core
+
+    def add(self, state_id, action_id, reward, next_state_id, done):
+        i = self.position
+        self.state_ids[i] = state_id
+        self.action_ids[i] = action_id
+        self.rewards[i] = reward
+        self.next_state_ids[i] = next_state_id
+        self.dones[i] = done
+        self.priorities[i] = self.max_priority
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_batch(self, state_ids, action_ids, rewards, next_state_ids, dones):
+        indices = (self.position + np.arange(len(state_ids))) % self.capacity
+        self.state_ids[indices] = state_ids
+        self.action_ids[indices] = action_ids
+        self.rewards[indices] = rewards
+        self.next_state_ids[indices] = next_state_ids
+        self.dones[indices] = dones
+        self.priorities[indices] = self.max_priority
+        self.position = (self.position + len(state_ids)) % self.capacity
+        self.size = min(self.size + len(state_ids), self.capacity)
+
+    def sample(self, batch_size):
+        """
+        :param batch_size: <int> number of transitions, drawn with replacement
+        :return: <tuple> indices, state ids, action ids, rewards, next state ids, dones and importance sampling
+                 weights (all ones for uniform sampling)
+        """
+        if not self.is_prioritized():
+            indices = np.random.randint(self.size, size=batch_size)
+            weights = np.ones(batch_size)
+        else:
+            cdf = np.cumsum(self.priorities[:self.size] ** self.alpha)
+            indices = np.searchsorted(cdf, np.random.random(batch_size) * cdf[-1], side="right")
+            indices = np.minimum(indices, self.size - 1)
+            probs = self.priorities[indices] ** self.alpha / cdf[-1]
+            weights = (self.size * probs) ** -self.beta
+            weights /= weights.max()
+        return (indices, self.state_ids[indices], self.action_ids[indices], self.rewards[indices],
+                self.next_state_ids[indices], self.dones[indices], weights)
+
+    def update_priorities(self, indices, td_errors):
+        priorities = np.abs(td_errors) + self.eps
+        self.priorities[indices] = priorities
+        self.max_priority = max(self.max_priority, priorities.max())
+
+    def clear(self):
+        self.max_priority = 1.0
+        self.position = 0
+        self.size = 0
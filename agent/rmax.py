@@ -1,8 +1,7 @@
 from agent.AgentBasis import AgentBasisClass
+from agent.qtable import QTable
+from agent.model import EmpiricalModel
 import numpy as np
-import random
-from collections import defaultdict
-import itertools
 
 
 class RMAXAgent(AgentBasisClass):
@@ -12,17 +11,32 @@ class RMAXAgent(AgentBasisClass):
                  u_count=2,
                  gamma=0.99,
                  actions=None,
-                 epsilon=0.1):
+                 epsilon=0.1,
+                 background=False):
+        """
+        :param background: <bool> if true, value iteration runs on a background thread and act() serves the
+                           greedy policy of the latest finished iteration
+        """
         super().__init__(name, actions, gamma)
         self.u_count = self.init_urate = u_count
         self.epsilon = self.init_epsilon = epsilon
         self.rmax = self.init_rmax = rmax
         self.explore = "greedy"
 
-        self.Q = defaultdict(lambda: defaultdict(lambda: self.rmax))
-        self.V = defaultdict(lambda: 0.0)
-        self.C_sas = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: 0)))
-        self.rewards = defaultdict(lambda: defaultdict(list))
+        self.Q = QTable(default=self.rmax)
+        self.model = EmpiricalModel()
+        self.__init_known_model()
+        self.set_background_planning(background)
+
+    def __init_known_model(self):
+        # the model of known pairs as sparse rows: pair k moves to state model_cols[i] with model_probs[i]
+        # for every i with model_rows[i] == k
+        self.known_state_ids = []
+        self.known_action_ids = []
+        self.known_rewards = []
+        self.model_rows = []
+        self.model_cols = []
+        self.model_probs = []
 
     # Accessors
 
@@ -32,13 +46,14 @@ class RMAXAgent(AgentBasisClass):
         params["epsilon"] = self.epsilon
         params["rmax"] = self.rmax
         params["explore"] = self.explore
+        params["background"] = self.planner is not None
         return params
 
     def get_urate(self):
         return self.u_count
 
     def get_q_val(self, state, action):
-        return self.Q[state][action]
+        return self.Q.get(state, action)
 
     def get_policy(self, state):
         return self._get_max_q_key(state)
@@ -47,22 +62,13 @@ class RMAXAgent(AgentBasisClass):
         return self._get_max_q_val(state)
 
     def get_reward(self, state, action):
-        if self.get_count(state, action) == 0:
-            return 0.0
-        return float(sum(self.rewards[state][action])) / self.get_count(state, action)
+        return self.model.get_reward(state, action)
 
     def get_transition(self, state, action):
-        next_state_probabilities = dict()
-        for next_state in self.C_sas[state][action].keys():
-            prob = self.get_count(state, action, next_state) / self.get_count(state, action)
-            next_state_probabilities[next_state] = prob
-        return next_state_probabilities
+        return self.model.get_transition(state, action)
 
     def get_count(self, state, action, next_state=None):
-        if next_state is None:
-            return sum(self.C_sas[state][action].values())
-        else:
-            return self.C_sas[state][action][next_state]
+        return self.model.get_count(state, action, next_state)
 
     # Setters
 
@@ -72,47 +78,69 @@ class RMAXAgent(AgentBasisClass):
     # Core
 
     def act(self, state):
-        action = self._get_max_q_key(state)
+        action = self._get_policy_table().get_greedy(state, self.get_executable_actions(state))[0]
 
         self._number_of_steps += 1
 
         return action
 
     def update(self, state, action, reward, next_state, done=False, **kwargs):
-        if not done:
-            self.C_sas[state][action][next_state] += 1
-            self.rewards[state][action] += [reward]
-        if self.get_count(state, action) == self.u_count:
-            self._update_policy_iteration()
-            # lim = int(np.log(1 / (self.epsilon * (1 - self.gamma))) / (1 - self.gamma))
-            # for l in range(0, lim):
-            #     for s in self.C_sas.keys():
-            #         for a in self.C_sas[s].keys():
-            #             if self.get_count(s, a) >= self.u_count:
-            #                 next_state_probabilities = self.get_transition(s, a)
-            #                 self.Q[s][a] = self.get_reward(s, a)
-            #                 for ns, p in next_state_probabilities.items():
-            #                     self.Q[s][a] += self.gamma * p * self._get_max_q_val(ns)
-            #                     # print(s, a, self.Q[s][a])
+        if done:
+            return
+        with self._get_lock():
+            self.model.add(state, action, reward, next_state)
+            newly_known = self.get_count(state, action) == self.u_count
+            if newly_known:
+                self._add_known(state, action)
+        if newly_known:
+            self._request_plan()
+
+    def _add_known(self, state, action):
+        """ append the empirical model of a newly known pair to the sparse known model """
+        row = len(self.known_rewards)
+        self.known_state_ids.append(self.Q.get_state_id(state, add=True))
+        self.known_action_ids.append(self.Q.get_action_id(action, add=True))
+        self.known_rewards.append(self.get_reward(state, action))
+        for next_state, prob in self.get_transition(state, action).items():
+            self.model_rows.append(row)
+            self.model_cols.append(self.Q.get_state_id(next_state, add=True))
+            self.model_probs.append(prob)
 
     def _update_policy_iteration(self):
-        lim = int(np.log(1 / (self.epsilon * (1 - self.__gamma))) / (1 - self.__gamma))
-        tmp = list(map(lambda x: itertools.product(self.C_sas.keys(), self.C_sas[x].keys()), self.C_sas.keys())) * lim
+        """
+        value iteration over the known pairs. unknown pairs keep rmax. it starts from the current Q-values, so
+        a newly known pair only costs the sweeps needed to propagate its change, and stops when the largest
+        change of a sweep is below epsilon * (1 - gamma) (or after log(1 / (epsilon * (1 - gamma))) / (1 - gamma)
+        sweeps)
+        """
+        gamma = self.get_gamma()
+        lim = int(np.log(1 / (self.epsilon * (1 - gamma))) / (1 - gamma))
+        lock = self._get_lock()
+        with lock:
+            state_ids, action_ids = np.array(self.known_state_ids), np.array(self.known_action_ids)
+            rewards = np.array(self.known_rewards)
+            rows, cols, probs = np.array(self.model_rows), np.array(self.model_cols), np.array(self.model_probs)
+            all_state_ids = np.arange(len(self.Q))
         for l in range(0, lim):
-            for s, a in tmp[l]:
-                if self.get_count(s, a) >= self.u_count:
-                    next_state_probabilities = self.get_transition(s, a)
-                    self.Q[s][a] = self.get_reward(s, a) + self.__gamma * sum(
-                        [p * self._get_max_q_val(ns) for ns, p in next_state_probabilities.items()])
-                    # print(s, a, self.Q[s][a])
+            # the lock is taken per sweep, so update() never waits for a whole iteration
+            with lock:
+                values = self._get_action_rows(all_state_ids).max(axis=1)
+                q_vals = rewards + gamma * np.bincount(rows, weights=probs * values[cols], minlength=len(rewards))
+                residual = np.abs(q_vals - self.Q.values[state_ids, action_ids]).max()
+                self.Q.values[state_ids, action_ids] = q_vals
+            if residual < self.epsilon * (1 - gamma):
+                break
+
+    # a planning pass of RMAX is a value iteration over the known model
+    _plan = _update_policy_iteration
 
     def reset(self):
         super().reset()
         self.u_count = self.init_urate
         self.epsilon = self.init_epsilon
-        self.Q = defaultdict(lambda: defaultdict(lambda: self.rmax))
-        self.C_sas = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: 0)))
-        self.rewards = defaultdict(lambda: defaultdict(list))
+        self.Q = QTable(default=self.rmax)
+        self.model = EmpiricalModel()
+        self.__init_known_model()
 
     def _get_max_q_key(self, state):
         return self._get_max_q(state)[0]
@@ -121,14 +149,4 @@ class RMAXAgent(AgentBasisClass):
         return self._get_max_q(state)[1]
 
     def _get_max_q(self, state):
-        tmp = self.__actions
-        best_action = random.choice(tmp)
-        actions = tmp[:]
-        np.random.shuffle(actions)
-        max_q_val = float("-inf")
-        for key in actions:
-            q_val = self.get_q_val(state, key)
-            if q_val > max_q_val:
-                best_action = key
-                max_q_val = q_val
-        return best_action, max_q_val
+        return self.Q.get_greedy(state, self.get_executable_actions(state))
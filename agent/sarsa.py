@@ -1,5 +1,5 @@
 from agent.AgentBasis import AgentBasisClass
-from collections import defaultdict
+from agent.qtable import QTable
 import numpy as np
 import random
 
@@ -11,13 +11,15 @@ class SarsaAgent(AgentBasisClass):
                  gamma=0.99,
                  epsilon=0.1,
                  actions=None,
-                 explore="uniform"):
+                 explore="uniform",
+                 temperature=1.0):
         super().__init__(name, actions, gamma)
         self.alpha = self.init_alpha = alpha
         self.epsilon = self.init_epsilon = epsilon
         self.explore = explore
+        self.temperature = temperature
 
-        self.Q = defaultdict(lambda: defaultdict(lambda: 0.0))
+        self.Q = QTable()
 
         # Accessors
 
@@ -26,13 +28,14 @@ class SarsaAgent(AgentBasisClass):
         params["alpha"] = self.alpha
         params["epsilon"] = self.epsilon
         params["explore"] = self.explore
+        params["temperature"] = self.temperature
         return params
 
     def get_alpha(self):
         return self.alpha
 
     def get_q_val(self, state, action):
-        return self.Q[state][action]
+        return self.Q.get(state, action)
 
     def get_policy(self, state):
         return self._get_max_q_key(state)
@@ -48,14 +51,7 @@ class SarsaAgent(AgentBasisClass):
         # Core
 
     def act(self, state):
-        if self.explore == "uniform":
-            action = self._epsilon_greedy_policy(state)
-        elif self.explore == "softmax":
-            action = self._soft_max_policy(state)
-        elif self.explore == "random":
-            action = random.choice(self.__actions)
-        else:
-            action = self._epsilon_greedy_policy(state)  # default
+        action = self._explore_policy(state)
 
         self._number_of_steps += 1
 
@@ -64,19 +60,34 @@ class SarsaAgent(AgentBasisClass):
     def update(self, state, action, reward, next_state, done=False, **kwargs):
         next_action_value = 0
         if not done:
-            if self.explore == "uniform": next_action = self._epsilon_greedy_policy(state)
-            elif self.explore == "softmax": next_action = self._soft_max_policy(state)
-            elif self.explore == "random": next_action = random.choice(self.__actions)
-            else: next_action = self._epsilon_greedy_policy(state)  # default
+            next_action = self._explore_policy(next_state)
             next_action_value = self.get_q_val(next_state, next_action)
-        diff = self.__gamma * next_action_value - self.get_q_val(state, action)
-        self.Q[state][action] += self.alpha * (reward + diff)
+        diff = self.get_gamma() * next_action_value - self.get_q_val(state, action)
+        self.Q.add(state, action, self.alpha * (reward + diff))
+
+    def update_batch(self, states, actions, rewards, next_states, dones, next_actions=None):
+        """
+        Vectorized update. every target is computed from the Q-values before the batch, and the updates of
+        repeated (state, action) pairs are merged (see QTable.add_merged)
+        :param next_actions: <list> actions taken in next_states. if None, they are drawn from the exploration policy
+        """
+        state_ids = self.Q.get_state_ids(states, add=True)
+        action_ids = self.Q.get_action_ids(actions, add=True)
+        next_state_ids = self.Q.get_state_ids(next_states)
+        if next_actions is None:
+            next_action_ids = self._get_next_action_ids(next_state_ids)
+        else:
+            next_action_ids = self.Q.get_action_ids(next_actions)
+        next_action_values = self.Q.values[next_state_ids, next_action_ids]
+        next_action_values[(next_state_ids < 0) | (next_action_ids < 0)] = self.Q.default
+        targets = np.asarray(rewards, dtype=float) + self.get_gamma() * np.where(dones, 0.0, next_action_values)
+        self.Q.add_merged(state_ids, action_ids, targets - self.Q.values[state_ids, action_ids], self.alpha)
 
     def reset(self):
         super().reset()
         self.alpha = self.init_alpha
         self.epsilon = self.init_epsilon
-        self.Q = defaultdict(lambda: defaultdict(lambda: 0.0))
+        self.Q = QTable()
 
     def _get_max_q_key(self, state):
         return self._get_max_q(state)[0]
@@ -85,24 +96,41 @@ class SarsaAgent(AgentBasisClass):
         return self._get_max_q(state)[1]
 
     def _get_max_q(self, state):
-        tmp = self.__actions
-        best_action = random.choice(tmp)
-        actions = tmp[:]
-        np.random.shuffle(actions)
-        max_q_val = float("-inf")
-        for key in actions:
-            q_val = self.get_q_val(state, key)
-            if q_val > max_q_val:
-                best_action = key
-                max_q_val = q_val
-        return best_action, max_q_val
+        return self.Q.get_greedy(state, self.get_executable_actions(state))
+
+    def _explore_policy(self, state):
+        if self.explore == "uniform":
+            action = self._epsilon_greedy_policy(state)
+        elif self.explore == "softmax":
+            action = self._soft_max_policy(state)
+        elif self.explore == "random":
+            action = random.choice(self.get_executable_actions(state))
+        else:
+            action = self._epsilon_greedy_policy(state)  # default
+        return action
 
     def _soft_max_policy(self, state):
-        pass
+        return self.Q.get_softmax(state, self.get_executable_actions(state), self.temperature)
+
+    def _get_next_action_ids(self, state_ids):
+        """ draw actions of many states from the exploration policy among their executable actions, as action ids """
+        column_ids = self.Q.get_action_ids(self.get_actions(), add=True)
+        if self.explore == "softmax":
+            return self.Q.get_softmax_batch(state_ids, column_ids, self.temperature, self._executable_actions)
+        if self.explore == "random":
+            action_ids, explore = np.zeros(len(state_ids), dtype=int), np.ones(len(state_ids), dtype=bool)
+        else:
+            action_ids, _ = self.Q.get_greedy_batch(state_ids, column_ids, self._executable_actions)
+            explore = np.random.random(len(state_ids)) < self.epsilon
+        if explore.any():
+            # uniform among the executable actions, i.e. the finite entries of the row
+            rows = self._get_action_rows(state_ids[explore])
+            action_ids[explore] = np.argmax(np.random.random(rows.shape) * np.isfinite(rows), axis=1)
+        return action_ids
 
     def _epsilon_greedy_policy(self, state):
         if self.epsilon > random.random():
-            action = random.choice(self.__actions)
+            action = random.choice(self.get_executable_actions(state))
         else:
             action = self._get_max_q_key(state)
         return action
@@ -0,0 +1,78 @@
+from agent.AgentBasis import AgentBasisClass
+from agent.sarsa import SarsaAgent
+from agent.traces import EligibilityTraces
+
+
+class SarsaLambdaAgent(SarsaAgent):
+    def __init__(self,
+                 name="SarsaLambdaAgent",
+                 alpha=0.1,
+                 gamma=0.99,
+                 epsilon=0.1,
+                 lam=0.9,
+                 trace="replacing",
+                 cutoff=0.01,
+                 actions=None,
+                 explore="uniform",
+                 temperature=1.0):
+        """
+        SARSA(lambda). the next action drawn in update() is the one taken by the next act(), so the traces follow
+        the actions which are actually executed
+        :param lam: <float> decay rate of the eligibility traces
+        :param trace: <str> "replacing" or "accumulating"
+        :param cutoff: <float> traces below this value are dropped
+        """
+        super().__init__(name, alpha, gamma, epsilon, actions, explore, temperature)
+        self.lam = lam
+        self.trace = trace
+        self.cutoff = cutoff
+
+        self.traces = EligibilityTraces(cutoff, trace == "replacing")
+        self.next_state = self.next_action = None
+
+    # Accessors
+
+    def get_params(self):
+        params = super().get_params()
+        params["lambda"] = self.lam
+        params["trace"] = self.trace
+        params["cutoff"] = self.cutoff
+        return params
+
+    # Core
+
+    def act(self, state):
+        if self.next_action is not None and state == self.next_state and self.next_action in self.get_actions():
+            action = self.next_action
+            self._number_of_steps += 1
+        else:
+            action = super().act(state)
+        self.next_state = self.next_action = None
+        return action
+
+    def update(self, state, action, reward, next_state, done=False, **kwargs):
+        next_action_value = 0
+        if not done:
+            self.next_state, self.next_action = next_state, self._explore_policy(next_state)
+            next_action_value = self.get_q_val(next_state, self.next_action)
+        delta = reward + self.get_gamma() * next_action_value - self.get_q_val(state, action)
+
+        self.traces.visit(self.Q.get_state_id(state, add=True), self.Q.get_action_id(action, add=True))
+        self.traces.apply(self.Q.values, self.alpha * delta)
+        if done:
+            self.traces.clear()
+        else:
+            self.traces.decay(self.get_gamma() * self.lam)
+
+    # traces make every update depend on the previous one, so a batch is applied transition by transition
+    update_batch = AgentBasisClass.update_batch
+
+    def reset(self):
+        super().reset()
+        self.traces.clear()
+        self.next_state = self.next_action = None
+
+    def reset_of_episode(self):
+        super().reset_of_episode()
+        self.traces.clear()
+        self.next_state = self.next_action = None
@@ -0,0 +1,50 @@
+import numpy as np
+
+
+class EligibilityTraces(object):
+    def __init__(self, cutoff=0.01, replacing=True):
+        """
+        Sparse eligibility traces. only (state id, action id) entries whose trace is at least cutoff are kept,
+        so an update costs O(number of recently visited pairs) instead of O(size of the Q-table)
+        :param cutoff: <float> traces below this value are dropped
+        :param replacing: <bool> if true, a visit resets the trace to 1. otherwise traces accumulate
+        """
+        self.cutoff = cutoff
+        self.replacing = replacing
+        self.state_ids = np.empty(0, dtype=int)
+        self.action_ids = np.empty(0, dtype=int)
+        self.values = np.empty(0, dtype=float)
+
+    def __len__(self):
+        return len(self.values)
+
+    # Core
+
+    def visit(self, state_id, action_id):
+        if self.replacing:
+            keep = (self.state_ids != state_id) | (self.action_ids != action_id)
+            self.state_ids, self.action_ids, self.values = \
+                self.state_ids[keep], self.action_ids[keep], self.values[keep]
+        # an accumulating trace may be stored in several entries; np.add.at sums them when they are applied
+        self.state_ids = np.append(self.state_ids, state_id)
+        self.action_ids = np.append(self.action_ids, action_id)
+        self.values = np.append(self.values, 1.0)
+
+    def apply(self, q_values, step):
+        """
+        :param q_values: <np.ndarray> Q-values indexed by state id x action id, updated in place
+        :param step: <float> learning rate x TD error
+        """
+        np.add.at(q_values, (self.state_ids, self.action_ids), step * self.values)
+
+    def decay(self, factor):
+        self.values *= factor
+        keep = self.values >= self.cutoff
+        if not keep.all():
+            self.state_ids, self.action_ids, self.values = \
+                self.state_ids[keep], self.action_ids[keep], self.values[keep]
+
+    def clear(self):
+        self.state_ids = np.empty(0, dtype=int)
+        self.action_ids = np.empty(0, dtype=int)
+        self.values = np.empty(0, dtype=float)
@@ -12,3 +12,9 @@ python ../utils/graphics.py --mdp gridworld -w 100
 # Graphworld
 python ../mdp/graphworld/graphworld.py --mdpName graphworld2 -s 1 -e 1000 -i 50
 python ../utils/graphics.py --mdp graphworld2 -w 100
+
+# Sweep (cells already in datas/logs/sweeps/ are skipped)
+python -m exe.sweep --env graphworld -g agent=Q-Learning,Dyna-Q,RMAX -g gamma=0.9,0.99 -g lookahead=10,50 -s 4 -e 1000 -i 50 -w 8
+
+# Successive halving (the budget doubles from --min_episodes up to -e while half of the configurations are dropped)
+python -m exe.halving --env graphworld -g agent=Q-Learning,Sarsa,Dyna-Q,RMAX -g gamma=0.9,0.99 -g alpha=0.1,0.5 -s 4 -e 1000 --min_episodes 50 -i 50 -w 8
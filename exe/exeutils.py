@@ -1,7 +1,10 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import pandas as pd
 import numpy as np
 import optparse
 import random
+import dill
 
 from exe.config import *
 
@@ -12,6 +15,7 @@ def run_episodes(env, agent, step=50, episode=100, s=0, display=False):
         # INIT ENV AND AGENT
         state = env.reset()
         agent.reset_of_episode()
+        agent.set_executable_actions(state, env.get_executable_actions(state))
         cumulative_reward = 0.0
         # print("-------- new episode: {0:02} starts --------".format(e))
         for t in range(0, step):
@@ -22,6 +26,8 @@ def run_episodes(env, agent, step=50, episode=100, s=0, display=False):
 
             # EXECUTE ACTION
             next_state, reward, done, info = env.step(action)
+            # agent bootstraps over the actions which can be selected at the next state
+            agent.set_executable_actions(next_state, env.get_executable_actions(next_state))
             # agent updates values
             agent.update(state, action, reward, next_state, done)
             # print(hash(state), state, action, reward, next_state, done)
@@ -45,23 +51,69 @@ def run_episodes(env, agent, step=50, episode=100, s=0, display=False):
                          list(env.get_params().values()) +
                          list(agent.get_params().values()))
 
+    # the run is over, so background planning must not keep a thread alive or change the pickled agent
+    agent.stop_planning()
     df = pd.DataFrame(data_list, columns=['Episode', 'Timestep', 'Cumulative Reward', 'seed'] +
                                          list(env.get_params().keys()) +
                                          list(agent.get_params().keys()))
     df.to_csv(LOG_DIR + "{0}_{1}_{2:02}_fin.csv".format(agent.get_name(), env.get_name(), s))
     env.to_pickle(LOG_DIR + "mdp_{0}_{1}_{2:02}_fin.pkl".format(agent.get_name(), env.get_name(), s))
     agent.to_pickle(LOG_DIR + "agent_{0}_{1}_{2:02}_fin.pkl".format(agent.get_name(), env.get_name(), s))
+    return df
 
 
-def runs_episodes(_mdp, _agent, step=50, episode=100, seed=10):
+def runs_episodes(_mdp, _agent, step=50, episode=100, seed=10, workers=1, factory=None, entropy=0):
+    """
+    Run episodes for the seeds 0, ..., seed - 1. before its episodes, each seed reseeds random and np.random
+    from its own child of np.random.SeedSequence(entropy), so a seed logs the same results whether it runs
+    serially or in a worker process
+    :param workers: <int> number of processes running seeds in parallel. 1 runs them serially on _mdp and _agent.
+                    workers are always spawned, so pickled states and agents are checked on every platform,
+                    not only where fork is the default
+    :param factory: <callable> module-level function returning a fresh (env, agent) in a worker process.
+                    if None, every worker gets a copy of _mdp and _agent
+    :param entropy: <int> root entropy of the seed sequence
+    :return: <list> log of every seed as a DataFrame
+    """
     print("Running experiment: {0} in {1}".format(_agent.get_name(), _mdp.get_name()))
-    for s in range(0, seed):
-        _agent.reset()
-        print("-------- [{0}] new seed: {1:02} starts --------".format(_agent.get_name(), s))
-        run_episodes(_mdp, _agent, step, episode, s)
+    seed_sequences = np.random.SeedSequence(entropy).spawn(seed)
+    if workers <= 1:
+        results = list()
+        for s in range(0, seed):
+            results.append(_run_seed(_mdp, _agent, step, episode, s, seed_sequences[s]))
+        return results
 
+    payload = None if factory is not None else dill.dumps((_mdp, _agent))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_run_seed_in_worker, factory, payload, step, episode, s, seed_sequences[s])
+                   for s in range(0, seed)]
+        return [future.result() for future in futures]
 
-def parse_options():
+
+def _run_seed(env, agent, step, episode, s, seed_sequence):
+    agent.reset()
+    print("-------- [{0}] new seed: {1:02} starts --------".format(agent.get_name(), s))
+    py_seed, np_seed = seed_sequence.generate_state(2)
+    random.seed(int(py_seed))
+    np.random.seed(int(np_seed))
+    return run_episodes(env, agent, step, episode, s)
+
+
+def _run_seed_in_worker(factory, payload, step, episode, s, seed_sequence):
+    env, agent = factory() if factory is not None else dill.loads(payload)
+    return _run_seed(env, agent, step, episode, s, seed_sequence)
+
+
+def parse_options(args=None):
+    """
+    :param args: <list> arguments to parse. if None, sys.argv[1:] is parsed
+    :return: <optparse.Values>
+    """
+    opts, _ = make_parser().parse_args(args)
+    return opts
+
+
+def make_parser():
     usage = "usage: %prog [options]"
     parser = optparse.OptionParser(usage=usage)
     parser.add_option('-s', '--seed',
@@ -70,6 +122,9 @@ def parse_options():
     parser.add_option('-e', '--episodes',
                       action='store', type='int', dest='episodes', default=2500, metavar="EPISODE",
                       help='Number of epsiodes of the MDP to run (default %default)')
+    parser.add_option('-w', '--workers',
+                      action='store', type='int', dest='workers', default=1, metavar="WORKERS",
+                      help='Number of processes running seeds in parallel (default %default)')
     parser.add_option('-i', '--iterations',
                       action='store', type='int', dest='iters', default=20, metavar="STEP",
                       help='Number of rounds of value iteration (default %default)')
@@ -98,6 +153,13 @@ def parse_options():
                       Dyna-Q,
                       RMAX
                       """)
+    parser.add_option('--env',
+                      action='store', metavar="ENV", type='string', dest='env', default="graphworld",
+                      help="""Environment type of a sweep (options are default %default)
+                      blockworld,
+                      gridworld,
+                      graphworld
+                      """)
     parser.add_option('--mdpName',
                       action='store', metavar="MDP_NAME", type='string', dest='mdpName', default="noName",
                       help="""MDP name (options are default %default)""")
@@ -110,7 +172,7 @@ def parse_options():
                       help='start node (default %default)')
     parser.add_option('--goal', action='store', type='int', dest='goal', default=17,
                       help='goal node (default %default)')
+    parser.add_option('-g', '--grid', action='append', metavar="OPTION=V1,V2,...", dest='grid', default=[],
+                      help='Values of an option to sweep over, e.g. --grid gamma=0.9,0.99 (repeatable)')
 
-    opts, args = parser.parse_args()
-
-    return opts
+    return parser
@@ -0,0 +1,73 @@
+import pandas as pd
+
+from exe.config import *
+from exe.sweep import SWEEP_DIR, get_cell_key, make_cells, parse_grid, run_cells, load_sweep
+import exe.exeutils
+
+
+def run_halving(grid, base=None, min_episodes=100, eta=2, workers=None, sweep_dir=SWEEP_DIR):
+    """
+    Successive halving over the configurations of a grid. every configuration runs min_episodes episodes,
+    the configurations are ranked by their mean cumulative reward, and the best 1 / eta of them run again with
+    eta times more episodes, until one is left or the budget reaches base["episodes"].
+    each rung runs its cells on a process pool and, as in a sweep, cells already logged in sweep_dir are reused
+    :param grid: <dict> option name -> list of values (episodes cannot be swept)
+    :param base: <dict> values of the other options (default: the defaults of parse_options)
+    :param min_episodes: <int> number of episodes of the first rung
+    :param eta: <int> a rung keeps 1 / eta of its configurations and multiplies the episodes by eta
+    :param workers: <int> number of processes (default: number of CPUs)
+    :param sweep_dir: <str> directory of the cell logs
+    :return: <pd.DataFrame> score and rank of every configuration in every rung
+    """
+    if "episodes" in grid:
+        raise ValueError("Cannot sweep over episodes; it is the budget of the rungs")
+    if eta < 2:
+        raise ValueError("eta must be at least 2")
+    base = base or vars(exe.exeutils.parse_options([]))
+    max_episodes = base["episodes"]
+    configs = make_cells(grid, base)
+    episodes = min(min_episodes, max_episodes)
+
+    results = list()
+    for rung in range(len(configs)):
+        cells = [dict(config, episodes=episodes) for config in configs]
+        print("-------- rung {0}: {1} configurations, {2} episodes --------".format(rung, len(cells), episodes))
+        # a failed configuration is dropped from the rung instead of stopping the others
+        failures = run_cells(cells, workers, sweep_dir)
+        cells = [c for c in cells if c not in failures]
+        if not cells:
+            raise RuntimeError("All configurations of rung {0} failed".format(rung))
+
+        scores = load_sweep(cells, sweep_dir).groupby("cell")["Cumulative Reward"].mean()
+        cells.sort(key=lambda c: scores[get_cell_key(c)], reverse=True)
+        for rank, config in enumerate(cells):
+            row = dict((name, config[name]) for name in sorted(grid))
+            row.update({"Rung": rung, "Episodes": episodes, "Rank": rank,
+                        "Cumulative Reward": scores[get_cell_key(config)], "cell": get_cell_key(config)})
+            results.append(row)
+
+        if len(cells) == 1 or episodes >= max_episodes:
+            break
+        configs = cells[:max(1, len(cells) // eta)]
+        episodes = min(episodes * eta, max_episodes)
+
+    return pd.DataFrame(results)
+
+
+def make_parser():
+    parser = exe.exeutils.make_parser()
+    parser.add_option('--eta', action='store', type='int', dest='eta', default=2,
+                      help='A rung keeps 1 / ETA of its configurations for ETA times more episodes (default %default)')
+    parser.add_option('--min_episodes', action='store', type='int', dest='min_episodes', default=100,
+                      help='Number of episodes of the first rung (default %default)')
+    return parser
+
+
+if __name__ == "__main__":
+    parser = make_parser()
+    opts, _ = parser.parse_args()
+    df = run_halving(parse_grid(opts.grid, parser), vars(opts), min_episodes=opts.min_episodes, eta=opts.eta,
+                     workers=opts.workers)
+    df.to_csv(LOG_DIR + "halving_{0}_fin.csv".format(opts.mdpName))
+    best = df[df["Rung"] == df["Rung"].max()].iloc[0]
+    print("Best configuration: {0}".format(best.to_dict()))
@@ -0,0 +1,179 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import itertools
+import hashlib
+import json
+import os
+
+from exe.config import *
+import exe.exeutils
+
+SWEEP_DIR = LOG_DIR + "sweeps/"
+
+# options which decide the result of a cell. a cell is addressed by the hash of their values
+CELL_KEYS = ("env", "mdpName", "path", "start", "goal", "agent", "gamma", "alpha", "epsilon", "lookahead", "rmax",
+             "u_count", "seeds", "episodes", "iters")
+
+
+def make_env(config):
+    if config["env"] == "blockworld":
+        from mdp.blockworld.blockworld import BlockWorld
+        return BlockWorld(name=config["mdpName"], width=5, height=5, init_loc=(0, 0), goal_loc=(4, 4),
+                          walls_loc=((3, 1), (3, 2), (3, 3), (0, 2), (1, 2), (1, 1),), holes_loc=(),
+                          step_cost=0.0, goal_reward=1)
+    elif config["env"] == "gridworld":
+        from mdp.gridworld.gridworld import GridWorld
+        from mdp.gridworld.map2 import MAP2
+        env = GridWorld(name=config["mdpName"], gridmap=MAP2)
+        env.set_step_cost(0.0)
+        env.set_goal_reward(1.0)
+        return env
+    elif config["env"] == "graphworld":
+        from mdp.graphworld.graphworld import GraphWorld
+        from mdp.graphworld.config import MAP_PATH
+        path = config["path"] if config["path"].endswith(".json") else MAP_PATH + "map2.json"
+        return GraphWorld(name=config["mdpName"], graphmap_path=path, init_node=config["start"],
+                          goal_node=config["goal"], step_cost=1.0, goal_reward=config["rmax"],
+                          stack_cost=config["rmax"])
+    raise ValueError("Unknown env: {0}".format(config["env"]))
+
+
+def make_agent(config, env, name):
+    actions = env.get_executable_actions()
+    if config["agent"] == "Q-Learning":
+        from agent.qlearning import QLearningAgent
+        return QLearningAgent(name=name, alpha=config["alpha"], gamma=config["gamma"], epsilon=config["epsilon"],
+                              actions=actions)
+    elif config["agent"] == "Sarsa":
+        from agent.sarsa import SarsaAgent
+        return SarsaAgent(name=name, alpha=config["alpha"], gamma=config["gamma"], epsilon=config["epsilon"],
+                          actions=actions)
+    elif config["agent"] == "Dyna-Q":
+        from agent.dynaq import DynaQAgent
+        return DynaQAgent(name=name, alpha=config["alpha"], gamma=config["gamma"], epsilon=config["epsilon"],
+                          lookahead=config["lookahead"], actions=actions)
+    elif config["agent"] == "RMAX":
+        from agent.rmax import RMAXAgent
+        return RMAXAgent(name=name, rmax=config["rmax"], u_count=config["u_count"], gamma=config["gamma"],
+                         epsilon=config["epsilon"], actions=actions)
+    raise ValueError("Unknown agent: {0}".format(config["agent"]))
+
+
+def get_cell_key(config):
+    """ content address of a cell: the hash of the options which decide its result """
+    text = json.dumps({k: config[k] for k in CELL_KEYS}, sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def get_expected_cost(config):
+    """ rough number of backups of a cell, used to start the longest cells first """
+    cost = config["seeds"] * config["episodes"] * config["iters"]
+    if config["agent"] == "Dyna-Q":
+        cost *= 1 + config["lookahead"]
+    elif config["agent"] == "RMAX":
+        cost *= 2
+    return cost
+
+
+def make_cells(grid, base):
+    """
+    :param grid: <dict> option name -> list of values
+    :param base: <dict> values of the other options
+    :return: <list> config of every combination of the grid values
+    """
+    names = sorted(grid)
+    cells = list()
+    for values in itertools.product(*[grid[name] for name in names]):
+        config = dict((k, base[k]) for k in CELL_KEYS)
+        config.update(zip(names, values))
+        cells.append(config)
+    return cells
+
+
+def parse_grid(items, parser=None):
+    """
+    :param items: <list> strings such as "gamma=0.9,0.99"
+    :param parser: <optparse.OptionParser> parser whose option types convert the values
+    :return: <dict> option name -> list of values
+    """
+    parser = parser or exe.exeutils.make_parser()
+    types = dict((option.dest, option.type) for option in parser.option_list if option.dest is not None)
+    convert = {"int": int, "float": float}
+    grid = dict()
+    for item in items:
+        name, values = item.split("=", 1)
+        if name not in CELL_KEYS:
+            raise ValueError("Cannot sweep over {0}".format(name))
+        grid[name] = [convert.get(types.get(name), str)(v) for v in values.split(",")]
+    return grid
+
+
+def run_cell(config, sweep_dir=SWEEP_DIR):
+    """ run all seeds of a cell and write its log. the log is written atomically, so a cell is either finished
+    or absent even if the sweep is interrupted """
+    key = get_cell_key(config)
+    env = make_env(config)
+    agent = make_agent(config, env, "{0}_{1}".format(config["agent"], key[:8]))
+    logs = exe.exeutils.runs_episodes(env, agent, step=config["iters"], episode=config["episodes"],
+                                      seed=config["seeds"])
+    df = pd.concat(logs, ignore_index=True)
+    df["cell"] = key
+    with open(sweep_dir + key + ".json", "w") as f:
+        json.dump(config, f, sort_keys=True)
+    df.to_csv(sweep_dir + key + ".csv.tmp")
+    os.replace(sweep_dir + key + ".csv.tmp", sweep_dir + key + ".csv")
+    return key
+
+
+def run_sweep(grid, base=None, workers=None, sweep_dir=SWEEP_DIR):
+    """
+    Run every cell of a grid on a process pool. cells whose log already exists in sweep_dir are skipped,
+    so an interrupted sweep resumes where it stopped when it is run again
+    :param grid: <dict> option name -> list of values
+    :param base: <dict> values of the other options (default: the defaults of parse_options)
+    :param workers: <int> number of processes (default: number of CPUs)
+    :param sweep_dir: <str> directory of the cell logs
+    :return: <pd.DataFrame> logs of all cells of the grid
+    """
+    base = base or vars(exe.exeutils.parse_options([]))
+    cells = make_cells(grid, base)
+    failures = run_cells(cells, workers, sweep_dir)
+    if failures:
+        raise RuntimeError("{0} of {1} cells failed".format(len(failures), len(cells)))
+    return load_sweep(cells, sweep_dir)
+
+
+def run_cells(cells, workers=None, sweep_dir=SWEEP_DIR):
+    """
+    Run the unfinished cells on a process pool, longest first
+    :return: <list> config of every cell which failed
+    """
+    os.makedirs(sweep_dir, exist_ok=True)
+    pending = [c for c in cells if not os.path.exists(sweep_dir + get_cell_key(c) + ".csv")]
+    pending.sort(key=get_expected_cost, reverse=True)
+    print("Sweep: {0} cells, {1} finished, {2} to run".format(len(cells), len(cells) - len(pending), len(pending)))
+
+    failures = list()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = dict((executor.submit(run_cell, config, sweep_dir), config) for config in pending)
+        for i, future in enumerate(as_completed(futures)):
+            # a failed cell does not stop the others; it stays pending and is retried by the next run
+            try:
+                key = future.result()
+            except Exception as e:
+                failures.append(futures[future])
+                print("-------- cell {0} failed: {1!r} --------".format(futures[future], e))
+                continue
+            print("-------- cell {0} finished ({1}/{2}) --------".format(key, i + 1, len(pending)))
+    return failures
+
+
+def load_sweep(cells, sweep_dir=SWEEP_DIR):
+    logs = [pd.read_csv(sweep_dir + get_cell_key(c) + ".csv", index_col=0) for c in cells]
+    return pd.concat(logs, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = exe.exeutils.make_parser()
+    opts, _ = parser.parse_args()
+    run_sweep(parse_grid(opts.grid, parser), vars(opts), workers=opts.workers)
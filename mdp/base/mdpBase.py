@@ -1,41 +1,116 @@
-import copy
 import dill
+from mdp.base.tabular import TabularMDP
 from typing import Union, List, Any, Optional, Tuple
 from collections import defaultdict
+from collections.abc import Mapping
+
+
+class StatePool(object):
+    """ canonical states of a state class and their dense integer ids """
+
+    def __init__(self):
+        self.__states = []
+        self.__index = dict()
+
+    def __len__(self):
+        return len(self.__states)
+
+    def get(self, key):
+        return self.__index.get(key)
+
+    def get_state(self, state_id):
+        return self.__states[state_id]
+
+    def add(self, key, state):
+        state._set_id(len(self.__states), key)
+        self.__states.append(state)
+        self.__index[key] = state
+        return state
+
+    def clear(self):
+        self.__states = []
+        self.__index = dict()
 
 
 class MDPStateClass(object):
+    """ immutable state. the hash is computed once at construction """
+    __slots__ = ("data", "_terminal", "_hash", "id", "_key")
+
     def __init__(self, data, is_terminal=False):
         self.data = data
-        self.__is_terminal = is_terminal
+        self._terminal = is_terminal
+        self._hash = _hash_data(data)
+        self.id = None
+        self._key = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._pool = StatePool()
+
+    @classmethod
+    def intern(cls, *args):
+        """ return the canonical state equal to cls(*args), creating it on the first call
+
+        :param args: positional arguments of the constructor
+        :return: MDPStateClass
+        """
+        state = cls._pool.get(args)
+        if state is None:
+            state = cls._pool.add(args, cls(*args))
+        return state
+
+    @classmethod
+    def get_pool(cls):
+        return cls._pool
 
     # Accessors
 
+    def get_id(self):
+        """ dense integer id of a canonical state (None if the state is not interned) """
+        return self.id
+
     def get_data(self):
         return self.data
 
     def is_terminal(self):
-        return self.__is_terminal
-
-    # Setters
-
-    def set_data(self, data):
-        self.data = data
-
-    def set_terminal(self, is_terminal=True):
-        self.__is_terminal = is_terminal
+        return self._terminal
 
     # Core
 
+    def __setattr__(self, key, value):
+        if hasattr(self, key):
+            raise AttributeError("{0} is immutable".format(type(self).__name__))
+        object.__setattr__(self, key, value)
+
+    def _set_id(self, state_id, key):
+        """ record the dense id and the intern key of a canonical state """
+        object.__setattr__(self, "id", state_id)
+        object.__setattr__(self, "_key", key)
+
+    def __reduce__(self):
+        # the cached hash is not pickled: hashes of None and of strings differ between processes.
+        # a canonical state is interned again in the loading process, so it also gets that process's id
+        if self._key is not None:
+            return _intern_state, (type(self), self._key)
+        slots = {name: getattr(self, name) for cls in type(self).__mro__ for name in getattr(cls, "__slots__", ())
+                 if name != "_hash" and hasattr(self, name)}
+        return _restore_state, (type(self), slots)
+
     def __hash__(self):
-        if self.data.__hash__ is None:
-            return hash(tuple(self.data))
-        else:
-            return hash(self.data)
+        return self._hash
 
     def __eq__(self, other):
+        if self is other:
+            return True
         assert isinstance(other, MDPStateClass), "Arg object is not in " + type(self).__module__
-        return self.data == other.data
+        return self._hash == other._hash and self.data == other.data
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # immutable, so copies can share the object
+        return self
 
     def __getitem__(self, index):
         return self.data[index]
@@ -44,6 +119,49 @@ class MDPStateClass(object):
         return len(self.data)
 
 
+def _hash_data(data):
+    return hash(data) if data.__hash__ is not None else hash(tuple(data))
+
+
+def _intern_state(cls, key):
+    return cls.intern(*key)
+
+
+def _restore_state(cls, slots):
+    """ rebuild a state which was not interned, computing its hash in this process """
+    state = cls.__new__(cls)
+    for name, value in slots.items():
+        object.__setattr__(state, name, value)
+    object.__setattr__(state, "_hash", _hash_data(state.data))
+    return state
+
+
+class LazyParams(Mapping):
+    """ read-only view of env.get_params() which is built on the first access """
+    __slots__ = ("_env", "_params")
+
+    def __init__(self, env):
+        self._env = env
+        self._params = None
+
+    def __get_params(self):
+        if self._params is None:
+            self._params = self._env.get_params()
+        return self._params
+
+    def __getitem__(self, key):
+        return self.__get_params()[key]
+
+    def __iter__(self):
+        return iter(self.__get_params())
+
+    def __len__(self):
+        return len(self.__get_params())
+
+    def __repr__(self):
+        return repr(self.__get_params())
+
+
 class MDPBasisClass(object):
     """ abstract class for a MDP """
 
@@ -52,8 +170,8 @@ class MDPBasisClass(object):
                  transition_func: Any,
                  reward_func: Any,
                  actions: Any = None):
-        self.__init_state = copy.deepcopy(init_state)
-        self.__current_state = copy.deepcopy(self.__init_state)
+        self.__init_state = init_state
+        self.__current_state = self.__init_state
         self.__actions = actions
         self.__transition_func = transition_func
         self.__reward_func = reward_func
@@ -92,10 +210,28 @@ class MDPBasisClass(object):
     def get_executable_actions(self, state=None):
         raise NotImplementedError
 
+    def is_executable(self, state, action):
+        """ whether action can be taken in state. export_tabular masks the actions which cannot
+
+        :param state: <MDPStateClass>
+        :param action: <Any>
+        :return: bool
+        """
+        return True
+
+    def get_transition_probs(self, state, action) -> List[Tuple[MDPStateClass, float]]:
+        """ get the distribution of next states, i.e. the explicit form of the transition function
+
+        :param state: <MDPStateClass>
+        :param action: <Any>
+        :return: list[tuple[MDPStateClass, float]] pairs of next state and its probability
+        """
+        raise NotImplementedError
+
     # Setters
 
     def set_init_state(self, new_init_state):
-        self.__init_state = copy.deepcopy(new_init_state)
+        self.__init_state = new_init_state
 
     def set_actions(self, new_actions):
         self.__actions = new_actions
@@ -105,24 +241,76 @@ class MDPBasisClass(object):
 
     # Core
 
-    def step(self, action: Any) -> Tuple[MDPStateClass, float, bool, dict]:
-        """ Proceed to next step
+    def step(self, action: Any) -> Tuple[MDPStateClass, float, bool, LazyParams]:
+        """ Proceed to next step. the info is a lazy view of get_params(), so it costs nothing unless it is read
 
         :param action: <Any>
-        :return: tuple[Any, float, bool, dict]
+        :return: tuple[Any, float, bool, LazyParams]
         """
         self.__state_counter[self.__current_state] += 1
         next_state = self.__transition_func(self.__current_state, action)
         reward = self.__reward_func(self.__current_state, action, next_state)
-        done = self.__current_state.is_terminal()
+        done = self._is_done(self.__current_state, next_state)
         self.__current_state = next_state
 
-        return next_state, reward, done, self.get_params()
+        return next_state, reward, done, LazyParams(self)
 
     def reset(self):
-        self.__current_state = copy.deepcopy(self.__init_state)
+        self.__current_state = self.__init_state
         return self.__current_state
 
+    def export_tabular(self, sparse=None) -> TabularMDP:
+        """ Enumerate states reachable from the initial state and compile the MDP into arrays
+
+        :param sparse: <bool> store the transition tensor as CSR. if None, it is chosen by its size
+        :return: TabularMDP
+        """
+        init_state = self.get_init_state()
+        actions = list(self.get_actions())
+        states = [init_state]
+        state_index = {self._get_state_key(init_state): 0}
+        rows, cols, probs, rewards, terminals, executable = [], [], [], [], [], []
+
+        # breadth first search; states is also used as the queue
+        i = 0
+        while i < len(states):
+            state = states[i]
+            terminals.append(state.is_terminal())
+            for j, action in enumerate(actions):
+                reward = 0.0
+                # a masked pair keeps no transition and no reward
+                executable.append(self.is_executable(state, action))
+                if not executable[-1]:
+                    rewards.append(reward)
+                    continue
+                for next_state, prob in self.get_transition_probs(state, action):
+                    key = self._get_state_key(next_state)
+                    if key not in state_index:
+                        state_index[key] = len(states)
+                        states.append(next_state)
+                    rows.append(i * len(actions) + j)
+                    cols.append(state_index[key])
+                    probs.append(prob)
+                    reward += prob * self.__reward_func(state, action, next_state)
+                rewards.append(reward)
+            i += 1
+
+        return TabularMDP(states, state_index, actions, rows, cols, probs, rewards, terminals,
+                          self._get_state_key, sparse=sparse, executable=executable)
+
+    def _is_done(self, state, next_state):
+        """ whether the step from state to next_state ends the episode. by default, the step out of a terminal state
+
+        :param state: <MDPStateClass>
+        :param next_state: <MDPStateClass>
+        :return: bool
+        """
+        return state.is_terminal()
+
+    def _get_state_key(self, state):
+        """ hashable key identifying a state of the underlying markov chain """
+        return state.get_data(), state.is_terminal()
+
     def to_pickle(self, filename):
         with open(filename, "wb") as f:
             dill.dump(self, f)
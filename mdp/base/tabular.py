@@ -0,0 +1,87 @@
+import numpy as np
+
+# above this many entries of P[s, a, s'] the transition tensor is stored as a sparse CSR matrix
+DENSE_LIMIT = 1000000
+
+
+class TabularMDP(object):
+    """ tabular (array) form of a MDP compiled by MDPBasisClass.export_tabular() """
+
+    def __init__(self, states, state_index, actions, rows, cols, probs, rewards, terminals, key_func, sparse=None,
+                 executable=None):
+        """
+        :param states: <list<MDPStateClass>> reachable states ordered by their index
+        :param state_index: <dict> state key -> state index
+        :param actions: <list> actions ordered by their index
+        :param rows: <list<int>> flat (state, action) index (s * |A| + a) of each transition
+        :param cols: <list<int>> next state index of each transition
+        :param probs: <list<float>> probability of each transition
+        :param rewards: <list<float>> expected reward of each (state, action) pair in flat order
+        :param terminals: <list<bool>> whether each state is terminal
+        :param key_func: <function> maps a state to its key in state_index
+        :param sparse: <bool> store P as CSR. if None, it is chosen by the size of P
+        :param executable: <list<bool>> whether each (state, action) pair in flat order can be taken.
+                           if None, every action can be taken in every state
+        """
+        self.states = states
+        self.state_index = state_index
+        self.actions = actions
+        self.action_index = {a: i for i, a in enumerate(actions)}
+        self.num_states = len(states)
+        self.num_actions = len(actions)
+        self.R = np.asarray(rewards, dtype=float).reshape(self.num_states, self.num_actions)
+        self.terminal = np.asarray(terminals, dtype=bool)
+        if executable is None:
+            self.executable = np.ones((self.num_states, self.num_actions), dtype=bool)
+        else:
+            self.executable = np.asarray(executable, dtype=bool).reshape(self.num_states, self.num_actions)
+        self.__key_func = key_func
+
+        if sparse is None:
+            sparse = self.num_states * self.num_actions * self.num_states > DENSE_LIMIT
+        self.sparse = sparse
+        if sparse:
+            from scipy.sparse import csr_matrix
+            # P[s * |A| + a, s']; duplicated entries are summed up by scipy
+            self.P = csr_matrix((probs, (rows, cols)),
+                                shape=(self.num_states * self.num_actions, self.num_states))
+        else:
+            self.P = np.zeros((self.num_states * self.num_actions, self.num_states))
+            np.add.at(self.P, (rows, cols), probs)
+            self.P = self.P.reshape(self.num_states, self.num_actions, self.num_states)
+
+    def __str__(self):
+        return "TabularMDP(|S|={0}, |A|={1}, sparse={2})".format(self.num_states, self.num_actions, self.sparse)
+
+    def __repr__(self):
+        return self.__str__()
+
+    # Accessors
+
+    def get_state_id(self, state):
+        return self.state_index[self.__key_func(state)]
+
+    def get_action_id(self, action):
+        return self.action_index[action]
+
+    def get_state(self, state_id):
+        return self.states[state_id]
+
+    def get_action(self, action_id):
+        return self.actions[action_id]
+
+    def get_flat_transition(self):
+        """ return P with shape (|S| * |A|, |S|) regardless of the storage """
+        if self.sparse:
+            return self.P
+        return self.P.reshape(self.num_states * self.num_actions, self.num_states)
+
+    # Core
+
+    def expected_next_values(self, values):
+        """ return sum_s' P[s, a, s'] * values[s'] with shape (|S|, |A|)
+
+        :param values: <np.ndarray> values of each state
+        :return: <np.ndarray>
+        """
+        return (self.get_flat_transition() @ values).reshape(self.num_states, self.num_actions)
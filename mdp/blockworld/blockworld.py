@@ -1,10 +1,14 @@
 from mdp.base.mdpBase import MDPBasisClass, MDPStateClass
+from collections import defaultdict
 import random
 import numpy as np
 
 # import copy
 
 ACTIONS = ["up", "down", "left", "right"]
+ACTION_INDEX = {a: i for i, a in enumerate(ACTIONS)}
+# displacement of each action in ACTIONS
+MOVES = ((0, 1), (0, -1), (-1, 0), (1, 0))
 
 
 class BlockWorld(MDPBasisClass):
@@ -47,14 +51,14 @@ class BlockWorld(MDPBasisClass):
         self.step_cost = step_cost
         self.hole_cost = hole_cost
         self.goal_reward = goal_reward
+        self.exit_flag = exit_flag
 
         if blockmap is not None:
             self.blocks = self.make_blockworld(blockmap)
         else:
             self.blocks = self.convert_blockworld()
 
-        self.init_state = BlockWorldState(self.init_loc[0], self.init_loc[1])
-        self.exit_flag = exit_flag
+        self._build_tables()
         print(self.init_state)
         super().__init__(self.init_state, self._transition_func, self._reward_func, ACTIONS)
 
@@ -66,6 +70,9 @@ class BlockWorld(MDPBasisClass):
 
     # Accessors
 
+    def get_name(self):
+        return self.name
+
     def get_params(self):
         get_params = super().get_params()
         get_params["EnvName"] = self.name
@@ -96,13 +103,10 @@ class BlockWorld(MDPBasisClass):
         return self.holes_loc
 
     def get_states(self):
-        flatten = lambda l: [item for sublist in l for item in sublist]
-        states = [[BlockWorldState(x, y) for y in range(self.height)] for x in range(self.width)]
-        return flatten(states)
+        return list(self.cell_states)
 
     def get_state(self, x, y):
-        states = [[BlockWorldState(x, y) for y in range(self.height)] for x in range(self.width)]
-        return states[x][y]
+        return self.cell_states[x * self.height + y]
 
     def get_executable_actions(self, state=None):
         if state is None:
@@ -125,21 +129,27 @@ class BlockWorld(MDPBasisClass):
 
     def set_init_loc(self, new_init_loc):
         self.init_loc = new_init_loc
+        self._update_init_state()
 
     def set_goal_locs(self, new_goal_locs):
         self.goal_loc = new_goal_locs
+        self._build_tables()
 
     def set_wall_locs(self, new_wall_locs):
         self.walls_loc = new_wall_locs
+        self._build_tables()
 
     def set_hole_locs(self, new_hole_locs):
         self.holes_loc = new_hole_locs
+        self._build_tables()
 
     def add_goals_loc(self, new_goal_loc):
         self.goal_loc.append(new_goal_loc)
+        self._build_tables()
 
     def add_holes_loc(self, new_hole_loc):
         self.holes_loc.append(new_hole_loc)
+        self._build_tables()
 
     # Core
 
@@ -155,7 +165,7 @@ class BlockWorld(MDPBasisClass):
         :return: next_state <State>
         """
 
-        if action not in self.get_executable_actions(state):
+        if action not in ACTION_INDEX:
             raise Exception("Illegal action!")
 
         if state.is_terminal():
@@ -165,24 +175,69 @@ class BlockWorld(MDPBasisClass):
             print("slip action: ")
             action = random.choice(self.get_actions())
 
-        x, y = state.get_data()
+        return self._get_next_state(state, action)
 
-        if action == "up" and self.__is_allowed(x, y + 1) and not self.__is_wall(x, y + 1):
-            next_state = BlockWorldState(x, y + 1)
-        elif action == "down" and self.__is_allowed(x, y - 1) and not self.__is_wall(x, y - 1):
-            next_state = BlockWorldState(x, y - 1)
-        elif action == "left" and self.__is_allowed(x - 1, y) and not self.__is_wall(x - 1, y):
-            next_state = BlockWorldState(x - 1, y)
-        elif action == "right" and self.__is_allowed(x + 1, y) and not self.__is_wall(x + 1, y):
-            next_state = BlockWorldState(x + 1, y)
-        else:
-            next_state = BlockWorldState(x, y)
+    def get_transition_probs(self, state, action):
+        """
+        return the distribution of next states after taking action in state
+        :param state: <State>
+        :param action: <str>
+        :return: <list<tuple<State, float>>> pairs of next state and its probability
+        """
+        if state.is_terminal():
+            return [(state, 1.0)]
+
+        next_state_probs = defaultdict(lambda: 0.0)
+        actions = self.get_actions()
+        for a in actions:
+            # a slip replaces the action with one chosen uniformly from all actions
+            prob = self.slip_prob / len(actions) + (1.0 - self.slip_prob) * (a == action)
+            if prob > 0.0:
+                next_state_probs[self._get_next_state(state, a)] += prob
+        return list(next_state_probs.items())
+
+    def _get_next_state(self, state, action):
+        """
+        deterministic part of the transition function
+        :param state: <State>
+        :param action: <str>
+        :return: next_state <State>
+        """
+        return self.cell_states[self.next_cell[state.x * self.height + state.y][ACTION_INDEX[action]]]
 
-        new_x, new_y = next_state.x, next_state.y
-        if ((new_x, new_y) in self.holes_loc or (new_x, new_y) == self.goal_loc) and self.exit_flag:
-            # print("goal")
-            next_state.set_terminal(True)
-        return next_state
+    def _build_tables(self):
+        """
+        precompute the next cell of every cell and action, and the hole/goal/terminal masks of cells.
+        the cell of (x, y) is x * height + y. it has to be called whenever the layout changes.
+        """
+        walls = set(self.walls_loc)
+        holes = set(self.holes_loc)
+        goals = set(self.goal_loc) if self.goal_loc and isinstance(self.goal_loc[0], tuple) else {self.goal_loc}
+
+        self.next_cell, self.hole_mask, self.goal_mask, self.cell_states = [], [], [], []
+        for x in range(self.width):
+            for y in range(self.height):
+                cell = x * self.height + y
+                next_cells = []
+                for dx, dy in MOVES:
+                    if self.__is_allowed(x + dx, y + dy) and (x + dx, y + dy) not in walls:
+                        next_cells.append(cell + dx * self.height + dy)
+                    else:
+                        next_cells.append(cell)
+                self.next_cell.append(tuple(next_cells))
+                self.hole_mask.append((x, y) in holes)
+                self.goal_mask.append((x, y) in goals)
+                is_terminal = (self.hole_mask[cell] or self.goal_mask[cell]) and self.exit_flag
+                self.cell_states.append(BlockWorldState.intern(x, y, is_terminal))
+        self._update_init_state()
+
+    def _update_init_state(self):
+        """
+        take the initial state from cell_states again, so that it follows the terminal mask of the current layout
+        """
+        if self.init_loc is not None and self.__is_allowed(*self.init_loc):
+            self.init_state = self.get_state(*self.init_loc)
+            self.set_init_state(self.init_state)
 
     def __is_allowed(self, x, y):
         """
@@ -197,17 +252,6 @@ class BlockWorld(MDPBasisClass):
             return False
         return True
 
-    def __is_wall(self, x, y):
-        """
-        return True if (x,y) is a wall location.
-        :param x: <int>
-        :param y: <int>
-        :return: <bool>
-        """
-        # if (x, y) in self.walls:
-        #     print("hit wall!")
-        return (x, y) in self.walls_loc
-
     def _reward_func(self, state, action, next_state):
         """
         return rewards in next_state after taking action in state
@@ -216,9 +260,10 @@ class BlockWorld(MDPBasisClass):
         :param next_state: <State>
         :return: reward <float>
         """
-        if (state.x, state.y) == self.goal_loc:
+        cell = state.x * self.height + state.y
+        if self.goal_mask[cell]:
             return self.get_goal_reward()
-        elif (state.x, state.y) in self.holes_loc:
+        elif self.hole_mask[cell]:
             return -self.get_hole_cost()
         else:
             return 0 - self.step_cost
@@ -275,6 +320,8 @@ class BlockWorld(MDPBasisClass):
 
 
 class BlockWorldState(MDPStateClass):
+    __slots__ = ("x", "y")
+
     def __init__(self, x, y, is_terminal=False):
         """
         A state in MDP
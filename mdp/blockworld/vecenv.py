@@ -0,0 +1,104 @@
+from mdp.blockworld.blockworld import ACTIONS
+import numpy as np
+
+# displacement of each action in ACTIONS ("up", "down", "left", "right")
+DX = np.array([0, 0, -1, 1])
+DY = np.array([1, -1, 0, 0])
+
+
+class BlockWorldVecEnv(object):
+    def __init__(self, env, num_envs=8, seed=None, auto_reset=True):
+        """
+        N independent copies of a BlockWorld stepped at once
+        :param env: <BlockWorld> world to copy the layout, rewards and slip probability from
+        :param num_envs: <int> number of copies
+        :param seed: <int or np.random.SeedSequence> seed of the random generator
+        :param auto_reset: <bool> if true, copies whose episode ended are reset within step()
+        """
+        self.name = env.name
+        self.num_envs = num_envs
+        self.width = env.width
+        self.height = env.height
+        self.init_loc = env.init_loc
+        self.slip_prob = env.get_slip_prob()
+        self.step_cost = env.step_cost
+        self.hole_cost = env.get_hole_cost()
+        self.goal_reward = env.get_goal_reward()
+        self.exit_flag = env.exit_flag
+        self.auto_reset = auto_reset
+        self.rng = np.random.default_rng(seed)
+
+        self.is_wall = self._make_mask(env.walls_loc)
+        self.is_hole = self._make_mask(env.holes_loc)
+        goal_loc = env.get_goal_loc()
+        self.is_goal = self._make_mask(goal_loc if isinstance(goal_loc[0], tuple) else (goal_loc,))
+        self.is_terminal = (self.is_hole | self.is_goal) & self.exit_flag
+
+        self.x = np.full(num_envs, self.init_loc[0], dtype=int)
+        self.y = np.full(num_envs, self.init_loc[1], dtype=int)
+
+    def __str__(self):
+        return "{0}_h-{1}_w-{2}_n-{3}".format(self.name, self.height, self.width, self.num_envs)
+
+    def __repr__(self):
+        return self.__str__()
+
+    # Accessors
+
+    def get_actions(self):
+        return ACTIONS
+
+    def get_locs(self):
+        """ return (x, y) of every copy with shape (num_envs, 2) """
+        return np.stack([self.x, self.y], axis=1)
+
+    # Core
+
+    def reset(self, mask=None):
+        """
+        reset copies to the initial location
+        :param mask: <np.ndarray<bool>> copies to reset. if None, all copies are reset
+        :return: <np.ndarray> (x, y) of every copy
+        """
+        if mask is None:
+            mask = slice(None)
+        self.x[mask] = self.init_loc[0]
+        self.y[mask] = self.init_loc[1]
+        return self.get_locs()
+
+    def step(self, actions):
+        """
+        proceed every copy by one step. as in BlockWorld.step, the reward depends on the current location
+        and an episode is done when an action is taken in a terminal location.
+        :param actions: <np.ndarray<int>> index of the action in ACTIONS for every copy
+        :return: <tuple> locations, rewards, dones and info. with auto_reset, the locations of done copies are the
+                 initial location and info["final_locs"] holds the locations before the reset
+        """
+        actions = np.asarray(actions)
+        x, y = self.x, self.y
+
+        rewards = np.where(self.is_goal[x, y], self.goal_reward,
+                           np.where(self.is_hole[x, y], -self.hole_cost, -self.step_cost))
+        dones = self.is_terminal[x, y]
+
+        slips = self.rng.random(self.num_envs) < self.slip_prob
+        actions = np.where(slips, self.rng.integers(len(ACTIONS), size=self.num_envs), actions)
+
+        next_x, next_y = x + DX[actions], y + DY[actions]
+        inside = (next_x >= 0) & (next_x < self.width) & (next_y >= 0) & (next_y < self.height)
+        next_x, next_y = np.where(inside, next_x, x), np.where(inside, next_y, y)
+        moves = ~self.is_wall[next_x, next_y] & ~dones
+        self.x, self.y = np.where(moves, next_x, x), np.where(moves, next_y, y)
+
+        info = dict()
+        if self.auto_reset and dones.any():
+            info["final_locs"] = self.get_locs()
+            self.reset(dones)
+        return self.get_locs(), rewards, dones, info
+
+    def _make_mask(self, locs):
+        mask = np.zeros((self.width, self.height), dtype=bool)
+        for loc in locs:
+            if len(loc) == 2:
+                mask[loc[0], loc[1]] = True
+        return mask
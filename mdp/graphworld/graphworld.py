@@ -4,9 +4,10 @@ from collections import defaultdict
 import random
 import networkx as nx
 import json
-import copy
 import matplotlib.pyplot as plt
 
+VERBS = ["goto", "approach", "opendoor", "gothrough"]
+
 
 class GraphWorld(MDPBasisClass):
     def __init__(self,
@@ -31,27 +32,24 @@ class GraphWorld(MDPBasisClass):
             self.graph, self.G = self.make_graph(graphmap_path)
         else:
             self.graph, self.G = self.convert_graphworld()
-        self.init_graph = copy.deepcopy(self.graph)
+        # bit index of each door in the door mask used by the tabular model
+        self.door_bits = {d: i for i, d in enumerate(sorted({v['door_id'] for v in self.graph.values()
+                                                             if v['door_id'] is not None}))}
 
         self.num_doors = len(node_has_door)
         self.number_of_states = (node_num - int(len(node_has_door) / 2)) * 2 ** len(node_has_door)
+        self.__actions = [(a, n) for a in VERBS for n in range(self.__node_num)]
+        self.action_index = {action: i for i, action in enumerate(self.__actions)}
+        # (node_id, door_id, door_open) -> (executable actions, the set of them)
+        self.__executable_actions = dict()
         self.goal_reward = goal_reward
         self.step_cost = step_cost
         self.stack_cost = stack_cost
 
-        self.init_state = GraphWorldState(self.graph[self.init_node]['node_id'],
-                                          self.graph[self.init_node]['door_id'],
-                                          self.graph[self.init_node]['door_open'],
-                                          self.graph[self.init_node]['success_rate'],
-                                          self.graph[self.init_node]['stack_rate'])
-
-        self.goal_state = GraphWorldState(self.graph[self.goal_node]['node_id'],
-                                          self.graph[self.goal_node]['door_id'],
-                                          self.graph[self.goal_node]['door_open'],
-                                          self.graph[self.goal_node]['success_rate'],
-                                          self.graph[self.goal_node]['stack_rate'])
-
         self.exit_flag = exit_flag
+        self.init_state = self._make_state(self.init_node, self._get_door_mask())
+        self.goal_state = self._make_state(self.goal_node, self._get_door_mask())
+
         super().__init__(self.init_state, self._transition_func, self._reward_func, self.get_actions())
 
     def __str__(self):
@@ -82,18 +80,13 @@ class GraphWorld(MDPBasisClass):
         return self.graph[node_id]['adjacent']
 
     def get_actions(self):
-        actions = [(a, n) for a in ["goto", "approach", "opendoor", "gothrough"] for n in range(self.__node_num)]
-
-        # actions = defaultdict(lambda: set())
-        # for node in self.graph.keys():
-        #     node_id, door_id, door_open, success_rate, stack_rate, adjacent = self.graph[node].values()
-        #     for action in ["goto", "approach", "opendoor", "gothrough"]:
-        #         for n in adjacent + [node_id]:
-        #             actions[GraphWorldState(node_id, door_id, False)].add((action, n))
-        #             actions[GraphWorldState(node_id, door_id, True)].add((action, n))
-        # for node, action in actions.items():
-        #     print(node, action)
-        return actions
+        return self.__actions
+
+    def get_action_id(self, action):
+        return self.action_index[action]
+
+    def get_action(self, action_id):
+        return self.__actions[action_id]
 
     def get_stack_cost(self):
         return self.stack_cost
@@ -107,8 +100,42 @@ class GraphWorld(MDPBasisClass):
     def get_executable_actions(self, state=None):
         if state is None:
             return self.get_executable_actions(self.init_state)
-        # return list(super().get_actions()[state])
-        return self.get_actions()
+        return self.__get_executable_entry(state)[0]
+
+    def get_executable_action_ids(self, state=None):
+        return [self.action_index[action] for action in self.get_executable_actions(state)]
+
+    def is_executable(self, state, action):
+        return action in self.__get_executable_entry(state)[1]
+
+    def __get_executable_entry(self, state):
+        key = state.get_data()
+        entry = self.__executable_actions.get(key)
+        if entry is None:
+            actions = self._make_executable_actions(state)
+            entry = self.__executable_actions[key] = (actions, frozenset(actions))
+        return entry
+
+    def _make_executable_actions(self, state):
+        """
+        actions which can change the state: goto/approach an adjacent node without/with a door,
+        open the closed door of the node and go through the open door of the node
+        :param state: <State>
+        :return: <list<tuple<str, int>>>
+        """
+        node_id = state.get_node_id()
+        actions = []
+        for n in self.get_adjacent(node_id):
+            door_id = self.graph[n]['door_id']
+            if door_id is None:
+                actions.append(("goto", n))
+            elif door_id != state.get_door_id():
+                actions.append(("approach", n))
+        if state.has_door():
+            actions.append(("gothrough", node_id) if state.get_door_state() else ("opendoor", node_id))
+        if not actions:
+            return list(self.__actions)
+        return actions
 
     # Setter
 
@@ -122,10 +149,13 @@ class GraphWorld(MDPBasisClass):
         self.stack_cost = new_stack_cost
 
     def set_door_open(self, node_id):
+        """ open a door from the beginning of episodes. during episodes, the door status is carried by states """
         self.graph[node_id]['door_open'] = True
         for node in self.graph[node_id]['adjacent']:
             if self.graph[node]['door_id'] == self.graph[node_id]['door_id']:
                 self.graph[node]['door_open'] = True
+        self.init_state = self._make_state(self.init_node, self._get_door_mask())
+        self.set_init_state(self.init_state)
 
     def make_graph(self, graphmap):
         with open(graphmap, 'r') as f:
@@ -155,7 +185,7 @@ class GraphWorld(MDPBasisClass):
         :return: next_state <State>
         """
 
-        if action not in self.get_executable_actions(state):
+        if not self.is_executable(state, action):
             raise Exception("Illegal action!: {} is not in {}".format(action, self.get_executable_actions(state)))
 
         if state.is_terminal():
@@ -172,39 +202,122 @@ class GraphWorld(MDPBasisClass):
 
         if 1 - state.stack_rate < rand and (a == "gothrough" or a == "opendoor" or a == "fail") \
                 and not self.is_goal_state(state):
-            next_state = state
-            state.is_stack = True
-            state.set_terminal(True)
+            return self._make_state(state.get_node_id(), state.door_mask, is_stack=True)
+
+        return self._get_next_state(state, a, n)
+
+    def get_transition_probs(self, state, action):
+        """
+        return the distribution of next states after taking action in state
+        :param state: <State>
+        :param action: <tuple <str, id>> action discription and node id
+        :return: <list<tuple<State, float>>> pairs of next state and its probability
+        """
+        if state.is_terminal():
+            return [(state, 1.0)]
+
+        a, n = action
+        success_rate, stack_rate = state.get_success_rate(), state.stack_rate
+        next_state_probs = dict()
+
+        # _transition_func uses a single uniform draw u: the action fails if u > success_rate
+        # and door actions get the agent stuck if u > 1 - stack_rate
+        if self.is_goal_state(state):
+            outcomes = [(a, n, 1.0)]
+        elif a == "gothrough" or a == "opendoor":
+            outcomes = [(a, n, min(success_rate, 1.0 - stack_rate)),
+                        ("fail", n, max(0.0, 1.0 - stack_rate - success_rate))]
+            if stack_rate > 0.0:
+                stack_state = self._make_state(state.get_node_id(), state.door_mask, is_stack=True)
+                next_state_probs[self._get_state_key(stack_state)] = [stack_state, stack_rate]
+        else:
+            adjacent = self.get_adjacent(state.get_node_id())
+            outcomes = [(a, n, success_rate)] + [(a, m, (1.0 - success_rate) / len(adjacent)) for m in adjacent]
+
+        for a, n, prob in outcomes:
+            if prob <= 0.0:
+                continue
+            next_state = self._get_next_state(state, a, n)
+            key = self._get_state_key(next_state)
+            if key in next_state_probs:
+                next_state_probs[key][1] += prob
+            else:
+                next_state_probs[key] = [next_state, prob]
+        return [tuple(v) for v in next_state_probs.values()]
+
+    def _get_next_state(self, state, a, n):
+        """
+        deterministic part of the transition function
+        :param state: <State>
+        :param a: <str> action discription
+        :param n: <int> node id
+        :return: next_state <State>
+        """
+        next_node, is_opened = self._get_next_node(state, a, n)
+        if next_node is None:
             return state
+        door_mask = state.door_mask
+        if is_opened:
+            door_mask |= 1 << self.door_bits[self.graph[next_node]['door_id']]
+        return self._make_state(next_node, door_mask)
 
+    def _get_next_node(self, state, a, n):
+        """
+        move of the agent on the graph
+        :param state: <State>
+        :param a: <str> action discription
+        :param n: <int> node id
+        :return: <tuple<int, bool>> next node id (None if the agent stays) and whether the action opens a door
+        """
         node_id, door_id, door_open, success_rate, stack_rate, adjacent = self.graph[n].values()
         if a == "opendoor" and state.has_door() and state.get_node_id() == node_id:
-            self.set_door_open(n)
-            node_id, door_id, door_open, success_rate, stack_rate, adjacent = self.graph[n].values()
-            next_state = GraphWorldState(node_id, door_id, door_open, success_rate, stack_rate)
+            return n, True
 
         elif a == "gothrough" and state.has_door() and state.get_door_state() and state.get_node_id() == node_id:
             next_node = None
             for node in adjacent:
                 if self.graph[node]['door_id'] == door_id:
                     next_node = node
-            n_node_id, n_door_id, n_door_open, n_success_rate, n_stack_rate, _ = self.graph[next_node].values()
-            next_state = GraphWorldState(n_node_id, n_door_id, n_door_open, n_success_rate, n_stack_rate)
+            return next_node, False
 
         elif a == "approach" and n in self.get_adjacent(
                 state.get_node_id()) and door_id is not None and state.get_door_id() != door_id:
-            next_state = GraphWorldState(node_id, door_id, door_open, success_rate, stack_rate)
+            return n, False
 
         elif a == "goto" and n in self.get_adjacent(state.get_node_id()) and self.graph[n]['door_id'] is None:
-            next_state = GraphWorldState(node_id, door_id, door_open, success_rate, stack_rate)
+            return n, False
 
-        else:
-            next_state = state
+        return None, False
 
-        if self.is_goal_state(next_state) and self.exit_flag:
-            next_state.set_terminal(True)
+    def _make_state(self, node, door_mask, is_stack=False):
+        """
+        return the canonical state of a node
+        :param node: <int> node id
+        :param door_mask: <int> bit mask of all open doors
+        :param is_stack: <bool> whether the agent got stuck at the node
+        :return: <State>
+        """
+        info = self.graph[node]
+        door_open = None
+        if info['door_id'] is not None:
+            door_open = bool(door_mask >> self.door_bits[info['door_id']] & 1)
+        is_terminal = is_stack or (node == self.goal_node and self.exit_flag)
+        return GraphWorldState.intern(info['node_id'], info['door_id'], door_open, info['success_rate'],
+                                      info['stack_rate'], is_terminal, door_mask, is_stack)
+
+    def _get_door_mask(self):
+        """
+        bit mask of the doors open in the graph, i.e. the door status of the initial state
+        :return: <int>
+        """
+        door_mask = 0
+        for node in self.graph.values():
+            if node['door_id'] is not None and node['door_open']:
+                door_mask |= 1 << self.door_bits[node['door_id']]
+        return door_mask
 
-        return next_state
+    def _get_state_key(self, state):
+        return state.get_node_id(), state.door_mask, state.get_is_stack(), state.is_terminal()
 
     def _reward_func(self, state, action, next_state):
         """
@@ -217,12 +330,18 @@ class GraphWorld(MDPBasisClass):
         if self.is_goal_state(state):
             return self.get_goal_reward()
         elif state.get_is_stack():
+            # the episode already ended on the step which got the agent stuck
+            return 0.0
+        elif next_state.get_is_stack():
             return 0 - self.get_stack_cost()
         else:
             return 0 - self.step_cost
 
+    def _is_done(self, state, next_state):
+        """ the step which gets the agent stuck pays the stack cost and ends the episode at once """
+        return state.is_terminal() or next_state.get_is_stack()
+
     def reset(self):
-        self.graph = copy.deepcopy(self.init_graph)
         return super().reset()
 
     def print_graph(self):
@@ -296,8 +415,10 @@ class GraphWorld(MDPBasisClass):
 
 
 class GraphWorldState(MDPStateClass):
+    __slots__ = ("node_id", "door_id", "_door_open", "is_stack", "success_rate", "stack_rate", "door_mask")
+
     def __init__(self, node_id, door_id, door_open, success_rate=1.0, stack_rate=0.0,
-                 is_terminal=False):
+                 is_terminal=False, door_mask=None, is_stack=False):
         """ Inheritance of MDPStateClass for graphworld
 
         :param node_id:
@@ -306,6 +427,8 @@ class GraphWorldState(MDPStateClass):
         :param success_rate:
         :param stack_rate:
         :param is_terminal:
+        :param door_mask: bit mask of all open doors
+        :param is_stack: whether the agent got stuck at this node
         """
         self.node_id = node_id
         self.door_id = door_id
@@ -313,13 +436,13 @@ class GraphWorldState(MDPStateClass):
             self._door_open = door_open
         else:
             self._door_open = None
-        self.is_stack = False
+        self.is_stack = is_stack
         self.success_rate = success_rate
         self.stack_rate = stack_rate
+        self.door_mask = door_mask
         super().__init__(data=(self.node_id, self.door_id, self._door_open), is_terminal=is_terminal)
 
-    def __hash__(self):
-        return hash(self.data)
+    __hash__ = MDPStateClass.__hash__
 
     def __str__(self):
         if self.has_door():
@@ -331,6 +454,8 @@ class GraphWorldState(MDPStateClass):
         return self.__str__()
 
     def __eq__(self, other):
+        if self is other:
+            return True
         assert isinstance(other, GraphWorldState), "Arg object is not in" + type(self).__module__
         return self.node_id == other.node_id
 
@@ -365,12 +490,6 @@ class GraphWorldState(MDPStateClass):
             return True
         return False
 
-    def set_success_rate(self, new_success_rate):
-        self.success_rate = new_success_rate
-
-    def set_stack_rate(self, new_stack_rate):
-        self.stack_rate = new_stack_rate
-
 
 if __name__ == "__main__":
     import exe.exeutils
@@ -416,10 +535,14 @@ if __name__ == "__main__":
     # exe.exeutils.runs_episodes(env, qlearning, step=opts.iters, episode=opts.episodes, seed=10)
     # exe.exeutils.runs_episodes(env, dynaq, step=opts.iters, episode=opts.episodes, seed=10)
 
-    exe.exeutils.runs_episodes(env, qlearning, step=opts.iters, episode=opts.episodes, seed=opts.seeds)
-    exe.exeutils.runs_episodes(env, dynaq, step=opts.iters, episode=opts.episodes, seed=opts.seeds)
-    exe.exeutils.runs_episodes(env, darling, step=opts.iters, episode=opts.episodes, seed=opts.seeds)
-    exe.exeutils.runs_episodes(env, gdq, step=opts.iters, episode=opts.episodes, seed=opts.seeds)
+    exe.exeutils.runs_episodes(env, qlearning, step=opts.iters, episode=opts.episodes, seed=opts.seeds,
+                               workers=opts.workers)
+    exe.exeutils.runs_episodes(env, dynaq, step=opts.iters, episode=opts.episodes, seed=opts.seeds,
+                               workers=opts.workers)
+    exe.exeutils.runs_episodes(env, darling, step=opts.iters, episode=opts.episodes, seed=opts.seeds,
+                               workers=opts.workers)
+    exe.exeutils.runs_episodes(env, gdq, step=opts.iters, episode=opts.episodes, seed=opts.seeds,
+                               workers=opts.workers)
 
     ###########################
     # MAKE PLOTS
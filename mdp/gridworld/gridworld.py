@@ -2,12 +2,13 @@
 from mdp.base.mdpBase import MDPBasisClass, MDPStateClass
 from mdp.gridworld.map2 import MAP2
 
-from collections import namedtuple
+from collections import defaultdict
 import numpy as np
 import random
-import copy
 
 ACTIONS = ["north", "south", "west", "east", "opendoor"]
+ACTION_INDEX = {a: i for i, a in enumerate(ACTIONS)}
+SUCCESS_RATE = 0.95
 
 
 class GridWorld(MDPBasisClass):
@@ -33,9 +34,7 @@ class GridWorld(MDPBasisClass):
             self.grid = self.make_gridworld(gridmap)
         else:
             self.grid = self.convert_gridworld()
-            self.door_loc = {"D_{0}{1}".format(i[0], i[1]): 0 for i in door_loc}
-
-        self.init_door_loc = copy.deepcopy(self.door_loc)
+            self.set_door_locs(door_loc)
 
         self.num_doors = len(door_loc)
         # row * columns * (open/close) ** doors
@@ -43,8 +42,11 @@ class GridWorld(MDPBasisClass):
         self.step_cost = step_cost
         self.goal_reward = goal_reward
 
-        self.init_state = GridWorldState(self.init_loc[0], self.init_loc[1], self.door_loc, is_terminal=False)
         self.exit_flag = exit_flag
+        if self.grid is not None:
+            self._build_tables()
+        init_doors = sum(1 << self.door_index[key] for key, is_open in self.door_loc.items() if is_open)
+        self.init_state = self.decode_state(self.encode(self.init_loc[0], self.init_loc[1], init_doors))
         super().__init__(self.init_state, self._transition_func, self._reward_func, ACTIONS)
 
     def __str__(self):
@@ -55,6 +57,9 @@ class GridWorld(MDPBasisClass):
 
     # Accessors
 
+    def get_name(self):
+        return self.name
+
     @staticmethod
     def get_door_key(x, y):
         return "D_{0}{1}".format(x, y)
@@ -85,6 +90,34 @@ class GridWorld(MDPBasisClass):
             return self.get_executable_actions(self.init_state)
         return self.get_actions()
 
+    def encode(self, x, y, doors):
+        """
+        pack a location and the door bits into a single int
+        :param x: <int>
+        :param y: <int>
+        :param doors: <int> bit mask of open doors (bit i is door_keys[i])
+        :return: <int>
+        """
+        return (doors * self.num_rows + y) * self.num_columns + x
+
+    def decode(self, code):
+        """
+        inverse of encode
+        :param code: <int>
+        :return: <tuple<int, int, int>> x, y and the bit mask of open doors
+        """
+        rest, x = divmod(code, self.num_columns)
+        doors, y = divmod(rest, self.num_rows)
+        return x, y, doors
+
+    def decode_state(self, code):
+        x, y, doors = self.decode(code)
+        return GridWorldState.intern(x, y, doors, self.is_terminal_code(code), code)
+
+    def is_terminal_code(self, code):
+        return self.exit_flag and code % (self.num_rows * self.num_columns) == \
+            self.goal_loc[1] * self.num_columns + self.goal_loc[0]
+
     # Setter
 
     def set_step_cost(self, new_step_cost):
@@ -101,13 +134,11 @@ class GridWorld(MDPBasisClass):
 
     def set_door_locs(self, new_door_locs):
         self.door_loc = {"D_{0}{1}".format(i[0], i[1]): 0 for i in tuple(new_door_locs)}
+        self.door_keys = list(self.door_loc.keys())
+        self.door_index = {key: i for i, key in enumerate(self.door_keys)}
 
     # Core
 
-    def reset(self):
-        self.door_loc = self.init_door_loc
-        return super().reset()
-
     def _transition_func(self, state, action):
         """
         transition function. it returns next state
@@ -122,43 +153,82 @@ class GridWorld(MDPBasisClass):
         if state.is_terminal():
             return state
 
-        x, y, d_list = state.get_data()
+        return self.decode_state(self.get_next_code(state.code, action, state.success_rate))
 
-        if state.success_rate < random.random():
-            # print("slip action: ")
-            action = random.choice(self.get_executable_actions(state))
-
-        if action == "north":
-            next_state = GridWorldState(x, min(y + 1, self.num_rows - 1), self.door_loc, is_terminal=False)
-
-        elif action == "south":
-            next_state = GridWorldState(x, max(y - 1, 0), self.door_loc, is_terminal=False)
-
-        elif action == "east" and (self.grid[self.num_rows - y, 2 * x + 2] == b":" or
-                                   (self.grid[self.num_rows - y, 2 * x + 2] == b";" and self.door_loc[self.get_door_key(x, y)])):
-            next_state = GridWorldState(min(x + 1, self.num_columns - 1), y, self.door_loc, is_terminal=False)
-
-        elif action == "west" and (self.grid[self.num_rows - y, 2 * x] == b":" or
-                                   (self.grid[self.num_rows - y, 2 * x] == b";" and self.door_loc[self.get_door_key(x - 1, y)])):
-            next_state = GridWorldState(max(x - 1, 0), y, self.door_loc, is_terminal=False)
-
-        elif action == "opendoor" and self.grid[self.num_rows - y, 2 * x + 2] == b";":
-            self.door_loc[self.get_door_key(x, y)] = 1
-            next_state = GridWorldState(x, y, self.door_loc, is_terminal=False)
-
-        elif action == "opendoor" and self.grid[self.num_rows - y, 2 * x] == b";":
-            self.door_loc[self.get_door_key(x - 1, y)] = 1
-            next_state = GridWorldState(x, y, self.door_loc, is_terminal=False)
-
-        else:
-            next_state = GridWorldState(x, y, self.door_loc, is_terminal=False)
+    def get_next_code(self, code, action, success_rate=SUCCESS_RATE):
+        """
+        transition function on the integer encoding. it returns the code of next state
+        :param code: <int>
+        :param action: <str>
+        :param success_rate: <float> probability of that the action is not replaced by a random one
+        :return: <int>
+        """
+        if self.is_terminal_code(code):
+            return code
 
-        if (next_state.x, next_state.y) == self.goal_loc and self.exit_flag:
-            next_state.set_terminal(True)
+        if success_rate < random.random():
+            # print("slip action: ")
+            action = random.choice(self.get_actions())
 
-        # print(next_state)
+        return self._get_next_code(code, action)
 
-        return next_state
+    def get_transition_probs(self, state, action):
+        """
+        return the distribution of next states after taking action in state
+        :param state: <State>
+        :param action: <str>
+        :return: <list<tuple<State, float>>> pairs of next state and its probability
+        """
+        if state.is_terminal():
+            return [(state, 1.0)]
+
+        next_code_probs = defaultdict(lambda: 0.0)
+        actions = self.get_executable_actions(state)
+        for a in actions:
+            # a slip replaces the action with one chosen uniformly from the executable actions
+            prob = (1.0 - state.success_rate) / len(actions) + state.success_rate * (a == action)
+            if prob > 0.0:
+                next_code_probs[self._get_next_code(state.code, a)] += prob
+        return [(self.decode_state(code), prob) for code, prob in next_code_probs.items()]
+
+    def _get_next_code(self, code, action):
+        """
+        deterministic part of the transition function on the integer encoding
+        :param code: <int>
+        :param action: <str>
+        :return: <int>
+        """
+        doors, cell = divmod(code, self.num_rows * self.num_columns)
+        next_cell, door, opened_door = self.moves[cell][ACTION_INDEX[action]]
+        if door >= 0 and not doors >> door & 1:
+            next_cell = cell
+        if opened_door >= 0:
+            doors |= 1 << opened_door
+        return doors * self.num_rows * self.num_columns + next_cell
+
+    def _build_tables(self):
+        """
+        compile the grid into moves[cell][action] = (next cell, door, opened door) where cell is
+        y * num_columns + x. the agent reaches the next cell only if the door is open (door is -1 if the move
+        does not pass a door) and the action opens opened_door (-1 if none).
+        """
+        self.moves = []
+        for y in range(self.num_rows):
+            for x in range(self.num_columns):
+                cell = y * self.num_columns + x
+                east, west = self.grid[self.num_rows - y, 2 * x + 2], self.grid[self.num_rows - y, 2 * x]
+                east_door = self.door_index[self.get_door_key(x, y)] if east == b";" else -1
+                west_door = self.door_index[self.get_door_key(x - 1, y)] if west == b";" else -1
+                # in the order of ACTIONS
+                moves = [(cell + self.num_columns if y + 1 < self.num_rows else cell, -1, -1),
+                         (cell - self.num_columns if y > 0 else cell, -1, -1),
+                         (cell - 1 if west in (b":", b";") and x > 0 else cell, west_door, -1),
+                         (cell + 1 if east in (b":", b";") and x + 1 < self.num_columns else cell, east_door, -1),
+                         (cell, -1, east_door if east_door >= 0 else west_door)]
+                self.moves.append(tuple(moves))
+
+    def _get_state_key(self, state):
+        return state.code
 
     def _reward_func(self, state, action, next_state):
         """
@@ -175,7 +245,7 @@ class GridWorld(MDPBasisClass):
 
     def make_gridworld(self, gridmap):
         self.num_rows = len(gridmap) - 2
-        self.num_columns = len(gridmap[0]) - 2
+        self.num_columns = (len(gridmap[0]) - 1) // 2
         door_loc = list()
         grid = np.asarray(gridmap, dtype='c')
         for ybar, line in enumerate(gridmap):
@@ -209,33 +279,47 @@ class GridWorld(MDPBasisClass):
 
 
 class GridWorldState(MDPStateClass):
-    def __init__(self, x, y, d_dict, is_terminal=False):
+    __slots__ = ("x", "y", "doors", "code", "success_rate")
+
+    def __init__(self, x, y, doors, is_terminal=False, code=None, success_rate=SUCCESS_RATE):
+        """
+        A state in gridworld
+        :param x: <int>
+        :param y: <int>
+        :param doors: <int> bit mask of open doors
+        :param is_terminal: <bool>
+        :param code: <int> GridWorld.encode(x, y, doors). states built by GridWorld always have it
+        :param success_rate: <float> probability of that an action is not replaced by a random one
+        """
         self.x = x
         self.y = y
-        self.doors = self.door_namedtuple(d_dict)
-        self.success_rate = 0.95
+        self.doors = doors
+        self.code = code
+        self.success_rate = success_rate
         super().__init__(data=(self.x, self.y, self.doors), is_terminal=is_terminal)
 
     def get_param(self):
         params_dict = dict()
         params_dict["success_rate"] = self.success_rate
 
+    def get_code(self):
+        return self.code
+
+    __hash__ = MDPStateClass.__hash__
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if self.code is None or getattr(other, "code", None) is None:
+            return super().__eq__(other)
+        return self.code == other.code
+
     def __str__(self):
         return "pos({0}, {1}, {2})".format(self.x, self.y, self.doors)
 
     def __repr__(self):
         return self.__str__()
 
-    def set_successrate(self, success_rate):
-        self.success_rate = success_rate
-
-    def door_namedtuple(self, v):
-        if isinstance(v, dict):
-            return namedtuple('D', v.keys())(**{x: self.door_namedtuple(y) for x, y in v.items()})
-        if isinstance(v, (list, tuple)):
-            return [self.door_namedtuple(x) for x in v]
-        return v
-
 
 if __name__ == "__main__":
     import exe.exeutils
@@ -259,4 +343,5 @@ if __name__ == "__main__":
     ###########################
     # RUN
     ###########################
-    exe.exeutils.runs_episodes(env, qlearning, step=opts.iters, episode=opts.episodes, seed=opts.seeds)
+    exe.exeutils.runs_episodes(env, qlearning, step=opts.iters, episode=opts.episodes, seed=opts.seeds,
+                               workers=opts.workers)
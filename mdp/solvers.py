@@ -0,0 +1,146 @@
+import time
+import numpy as np
+
+from mdp.base.tabular import TabularMDP
+
+
+def bellman_backup(model: TabularMDP, values, gamma=0.99):
+    """ one-step lookahead Q[s, a] = R[s, a] + gamma * sum_s' P[s, a, s'] * V[s'].
+    episodes end at terminal states, so they do not bootstrap. actions which cannot be taken get -inf.
+
+    :param model: <TabularMDP>
+    :param values: <np.ndarray> values of each state
+    :param gamma: <float> discount factor
+    :return: <np.ndarray> Q with shape (|S|, |A|)
+    """
+    q_values = model.expected_next_values(values)
+    q_values *= gamma
+    q_values[model.terminal] = 0.0
+    q_values += model.R
+    q_values[~model.executable] = -np.inf
+    return q_values
+
+
+def policy_evaluation(model: TabularMDP, policy, gamma=0.99):
+    """ exact value of a deterministic policy by solving (I - gamma * P_pi) V = R_pi
+
+    :param model: <TabularMDP>
+    :param policy: <np.ndarray> action id of each state
+    :param gamma: <float> discount factor
+    :return: <np.ndarray> values of each state
+    """
+    num_states = model.num_states
+    rows = np.arange(num_states) * model.num_actions + policy
+    p_pi = model.get_flat_transition()[rows] * gamma
+    r_pi = model.R[np.arange(num_states), policy]
+    if model.sparse:
+        from scipy.sparse import identity, diags
+        from scipy.sparse.linalg import spsolve
+        p_pi = diags((~model.terminal).astype(float)) @ p_pi
+        return spsolve((identity(num_states, format="csr") - p_pi).tocsc(), r_pi)
+    p_pi[model.terminal] = 0.0
+    return np.linalg.solve(np.eye(num_states) - p_pi, r_pi)
+
+
+def value_iteration(model: TabularMDP, gamma=0.99, tol=1e-6, max_iter=10000, verbose=False):
+    """ value iteration. it stops when the sup-norm of the value change is below tol
+
+    :param model: <TabularMDP>
+    :param gamma: <float> discount factor
+    :param tol: <float> convergence tolerance
+    :param max_iter: <int> maximum number of sweeps
+    :param verbose: <bool> print the number of sweeps and the elapsed time
+    :return: <dict> V, Q, policy, iterations, residual and time
+    """
+    start = time.perf_counter()
+    values = np.zeros(model.num_states)
+    q_values = model.R.copy()
+    residual = float("inf")
+    iteration = 0
+    while iteration < max_iter and residual >= tol:
+        q_values = bellman_backup(model, values, gamma)
+        new_values = q_values.max(axis=1)
+        residual = float(np.abs(new_values - values).max())
+        values = new_values
+        iteration += 1
+    return _make_result("value iteration", values, q_values, iteration, residual, start, verbose)
+
+
+def policy_iteration(model: TabularMDP, gamma=0.99, max_iter=1000, verbose=False):
+    """ policy iteration with exact policy evaluation. it stops when the greedy policy is stable
+
+    :param model: <TabularMDP>
+    :param gamma: <float> discount factor
+    :param max_iter: <int> maximum number of policy improvements
+    :param verbose: <bool> print the number of iterations and the elapsed time
+    :return: <dict> V, Q, policy, iterations, residual and time
+    """
+    start = time.perf_counter()
+    policy = _first_executable(model)
+    values = policy_evaluation(model, policy, gamma)
+    q_values = bellman_backup(model, values, gamma)
+    iteration = 0
+    while iteration < max_iter:
+        iteration += 1
+        new_policy = _improve(q_values, policy)
+        if np.array_equal(new_policy, policy):
+            break
+        policy = new_policy
+        values = policy_evaluation(model, policy, gamma)
+        q_values = bellman_backup(model, values, gamma)
+    residual = float(np.abs(q_values.max(axis=1) - values).max())
+    return _make_result("policy iteration", values, q_values, iteration, residual, start, verbose)
+
+
+def modified_policy_iteration(model: TabularMDP, gamma=0.99, tol=1e-6, max_iter=10000, eval_sweeps=20,
+                              verbose=False):
+    """ modified policy iteration, i.e. policy iteration whose evaluation is eval_sweeps Bellman sweeps
+
+    :param model: <TabularMDP>
+    :param gamma: <float> discount factor
+    :param tol: <float> convergence tolerance on the Bellman residual
+    :param max_iter: <int> maximum number of policy improvements
+    :param eval_sweeps: <int> number of sweeps of the partial policy evaluation
+    :param verbose: <bool> print the number of iterations and the elapsed time
+    :return: <dict> V, Q, policy, iterations, residual and time
+    """
+    start = time.perf_counter()
+    states = np.arange(model.num_states)
+    values = np.zeros(model.num_states)
+    policy = _first_executable(model)
+    residual = float("inf")
+    iteration = 0
+    while iteration < max_iter:
+        q_values = bellman_backup(model, values, gamma)
+        policy = _improve(q_values, policy)
+        new_values = q_values[states, policy]
+        residual = float(np.abs(new_values - values).max())
+        values = new_values
+        iteration += 1
+        if residual < tol:
+            break
+        for _ in range(eval_sweeps - 1):
+            values = bellman_backup(model, values, gamma)[states, policy]
+    q_values = bellman_backup(model, values, gamma)
+    return _make_result("modified policy iteration", values, q_values, iteration, residual, start, verbose)
+
+
+def _first_executable(model):
+    """ initial policy taking the first action which can be taken in each state """
+    return model.executable.argmax(axis=1)
+
+
+def _improve(q_values, policy):
+    """ greedy policy w.r.t. q_values which keeps the current action on ties, so that it terminates """
+    greedy = q_values.argmax(axis=1)
+    states = np.arange(len(policy))
+    keep = q_values[states, policy] >= q_values[states, greedy]
+    return np.where(keep, policy, greedy)
+
+
+def _make_result(name, values, q_values, iterations, residual, start, verbose):
+    elapsed = time.perf_counter() - start
+    if verbose:
+        print("{0}: {1} iterations, residual {2:.3e}, {3:.3f} sec".format(name, iterations, residual, elapsed))
+    return {"V": values, "Q": q_values, "policy": q_values.argmax(axis=1),
+            "iterations": iterations, "residual": residual, "time": elapsed}